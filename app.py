@@ -2,7 +2,7 @@ import os
 import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
 import requests
 from fastapi import HTTPException
@@ -29,6 +29,7 @@ from echo.models.auth import LoginResponse
 from echo.models.echo import (
     DeleteEchoConfig,
     Echo,
+    EchoSummary,
     GetEchoConfig,
     GetEchoResponse,
     ListEchoesConfig,
@@ -52,6 +53,7 @@ RECOGNIZER_MAX_IDLE_SECONDS_PER_WORK_DEFAULT = 120
 RECOGNIZER_MAX_PENDING_CALLS_PER_WORK_DEFAULT = 10
 RECOGNIZER_AUTOSCALER_CRON_SCHEDULE_DEFAULT = "*/5 * * * *"
 RECOGNIZER_CLOUD_COMPUTE_DEFAULT = "cpu"
+RECOGNIZER_AGING_RATE_DEFAULT = 1.0
 
 FILESERVER_CLOUD_COMPUTE_DEFAULT = "cpu"
 
@@ -64,6 +66,10 @@ YOUTUBER_CLOUD_COMPUTE_DEFAULT = "cpu"
 DATABASE_CLOUD_COMPUTE_DEFAULT = "cpu"
 
 USER_ECHOES_LIMIT_DEFAULT = 100
+# Largest page of Echoes returned at once
+LIST_ECHOES_MAX_LIMIT = 1000
+# Old Echoes deleted at once by the garbage collector
+GARBAGE_COLLECTION_BATCH_SIZE = 500
 SOURCE_TYPE_FILE_ENABLED_DEFAULT = "true"
 SOURCE_TYPE_RECORDING_ENABLED_DEFAULT = "true"
 SOURCE_TYPE_YOUTUBE_ENABLED_DEFAULT = "true"
@@ -124,6 +130,7 @@ class EchoApp(LightningFlow):
         self.recognizer_cloud_compute = os.environ.get(
             "ECHO_RECOGNIZER_CLOUD_COMPUTE", RECOGNIZER_CLOUD_COMPUTE_DEFAULT
         )
+        self.recognizer_aging_rate = float(os.environ.get("ECHO_RECOGNIZER_AGING_RATE", RECOGNIZER_AGING_RATE_DEFAULT))
         self.fileserver_cloud_compute = os.environ.get(
             "ECHO_FILESERVER_CLOUD_COMPUTE", FILESERVER_CLOUD_COMPUTE_DEFAULT
         )
@@ -184,7 +191,12 @@ class EchoApp(LightningFlow):
             max_idle_seconds_per_work=self.youtuber_max_idle_seconds_per_work,
             max_pending_calls_per_work=self.youtuber_max_pending_calls_per_work,
             create_work=lambda: YouTuber(cloud_compute=self.youtuber_cloud_compute, base_dir=base_dir),
-            dummy_run_kwargs={"youtube_url": DUMMY_YOUTUBE_URL, "echo_id": DUMMY_ECHO_ID, "fileserver_url": None},
+            dummy_run_kwargs={
+                "youtube_url": DUMMY_YOUTUBE_URL,
+                "echo_id": DUMMY_ECHO_ID,
+                "fileserver_url": None,
+                "db_url": None,
+            },
         )
         self.recognizer = LoadBalancer(
             name="recognizer",
@@ -194,6 +206,11 @@ class EchoApp(LightningFlow):
                 cloud_compute=self.recognizer_cloud_compute, drive=self.drive, model_size=self.model_size
             ),
             dummy_run_kwargs={"echo": dummy_echo, "db_url": None},
+            # Short Echoes are transcribed first, assuming the worst for Echoes of unknown duration
+            get_cost=lambda echo, db_url: (
+                echo.duration_seconds if echo.duration_seconds is not None else self.video_source_max_duration_seconds
+            ),
+            aging_rate=self.recognizer_aging_rate,
         )
 
     def run(self):
@@ -205,6 +222,10 @@ class EchoApp(LightningFlow):
             self._echo_db_client = DatabaseClient(model=Echo, db_url=self.database.db_url)
             self._segment_db_client = DatabaseClient(model=Segment, db_url=self.database.db_url)
 
+        # Hand queued calls to Works which have finished processing previous ones
+        self.recognizer.dispatch()
+        self.youtuber.dispatch()
+
         if self.schedule(self.recognizer_autoscaler_cron_schedule):
             self.recognizer.ensure_min_replicas(min_replicas=self.recognizer_min_replicas)
 
@@ -217,34 +238,69 @@ class EchoApp(LightningFlow):
     def _perform_garbage_collection(self):
         if self._echo_db_client is not None:
             created_before = datetime.now() - timedelta(seconds=self.garbage_collection_max_age_seconds)
-            old_echoes = self._echo_db_client.list_echoes(user_id=None, created_before=int(created_before.timestamp()))
-            for echo in old_echoes:
-                logger.info(f"Deleting old Echo {echo.id}")
-                self.delete_echo(config=DeleteEchoConfig(echo_id=echo.id))
+            while True:
+                # NOTE: Deleted Echoes drop out of the results, so the first page is always the next batch
+                old_echoes = self._echo_db_client.list_echo_summaries(
+                    user_id=None, created_before=int(created_before.timestamp()), limit=GARBAGE_COLLECTION_BATCH_SIZE
+                )
+                if len(old_echoes) == 0:
+                    return
+
+                logger.info(f"Deleting {len(old_echoes)} old Echoes")
+                try:
+                    self._echo_db_client.delete_echoes([echo.id for echo in old_echoes])
+                except Exception as e:
+                    logger.error(e)
+                    return
+
+                for echo in old_echoes:
+                    self._delete_file(echo.id)
 
     def create_echo(self, echo: Echo) -> Echo:
         if self._echo_db_client is None:
             logger.warn("Database client not initialized!")
             return None
 
+        if echo.duration_seconds is None and echo.source_youtube_url is None:
+            echo.duration_seconds = (self._get_uploaded_metadata(echo.id) or {}).get("duration")
+
         # Create Echo in the database
         self._echo_db_client.post(echo)
 
         # If source is YouTube, trigger async download of the video to the shared Drive
         if echo.source_youtube_url is not None:
-            self.youtuber.run(youtube_url=echo.source_youtube_url, echo_id=echo.id, fileserver_url=self.fileserver.url)
+            self.youtuber.run(
+                youtube_url=echo.source_youtube_url,
+                echo_id=echo.id,
+                fileserver_url=self.fileserver.url,
+                db_url=self.database.url,
+            )
 
         # Run speech recognition for the Echo
         self.recognizer.run(echo=echo, db_url=self.database.url)
 
         return echo
 
-    def list_echoes(self, config: ListEchoesConfig) -> List[Echo]:
+    def _get_uploaded_metadata(self, echo_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the metadata (duration, streams, etc) of the file uploaded for an Echo, as indexed by the
+        fileserver."""
+        try:
+            resp = requests.get(f"{self.fileserver.url}/metadata/{echo_id}", timeout=5)
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+            return resp.json()
+        except Exception as e:
+            logger.warn(f"Could not get metadata of uploaded file for Echo {echo_id}: {e}")
+            return None
+
+    def list_echoes(self, config: ListEchoesConfig) -> List[EchoSummary]:
         if self._echo_db_client is None:
             logger.warn("Database client not initialized!")
             return None
 
-        echoes = self._echo_db_client.list_echoes(config.user_id)
+        limit = min(max(config.limit or LIST_ECHOES_MAX_LIMIT, 1), LIST_ECHOES_MAX_LIMIT)
+        echoes = self._echo_db_client.list_echo_summaries(config.user_id, after=config.after, limit=limit)
 
         return echoes
 
@@ -257,11 +313,16 @@ class EchoApp(LightningFlow):
         if echo is None:
             return None
 
-        segments = None
+        segments, segments_cursor = None, None
         if config.include_segments:
-            segments = self._segment_db_client.list_segments_for_echo(config.echo_id)
+            segments = self._segment_db_client.list_segments_for_echo(
+                config.echo_id, after=config.segments_after, limit=config.segments_limit
+            )
+            # A full page means there may be more segments
+            if config.segments_limit is not None and len(segments) == config.segments_limit:
+                segments_cursor = segments[-1].cursor
 
-        return GetEchoResponse(echo=echo, segments=segments)
+        return GetEchoResponse(echo=echo, segments=segments, segments_cursor=segments_cursor)
 
     def delete_echo(self, config: DeleteEchoConfig) -> None:
         if self._echo_db_client is None:
@@ -269,18 +330,23 @@ class EchoApp(LightningFlow):
             return None
 
         try:
-            self._segment_db_client.delete_segments_for_echo(config.echo_id)
+            # Deleting the Echo (along with its segments) also cancels any recognition or download still running for it
             self._echo_db_client.delete_echo(config.echo_id)
+            self._delete_file(config.echo_id)
+        except Exception as e:
+            logger.error(e)
+
+        return None
 
+    def _delete_file(self, echo_id: str):
+        try:
             requests.post(
-                f"{self.fileserver.url}/delete/{config.echo_id}",
+                f"{self.fileserver.url}/delete/{echo_id}",
                 params={"auth_token": self._fileserver_auth_token if self._fileserver_auth_token else ""},
             )
         except Exception as e:
             logger.error(e)
 
-        return None
-
     def login(self):
         if not self.enable_multi_tenancy:
             return LoginResponse(user_id=DEFAULT_USER_ID)
@@ -308,8 +374,7 @@ class EchoApp(LightningFlow):
             )
 
         # Guard against exceeding per-user Echoes limit
-        echoes = self._echo_db_client.list_echoes(echo.user_id)
-        if len(echoes) >= self.user_echoes_limit:
+        if self._echo_db_client.count_echoes(echo.user_id) >= self.user_echoes_limit:
             return ValidateEchoResponse(valid=False, reason="User Echoes limit exceeded")
 
         if echo.source_youtube_url is not None:
@@ -320,6 +385,16 @@ class EchoApp(LightningFlow):
             if video_length > self.video_source_max_duration_seconds:
                 return ValidateEchoResponse(valid=False, reason="YouTube video exceeds maximum duration allowed")
 
+            # Saves looking up the video again to schedule its transcription
+            echo.duration_seconds = video_length
+        else:
+            # NOTE: Echoes can be validated before their file is uploaded, in which case there is nothing to check yet
+            metadata = self._get_uploaded_metadata(echo.id)
+            if metadata is not None:
+                if metadata.get("has_audio") is False:
+                    return ValidateEchoResponse(valid=False, reason="File does not contain any audio")
+                echo.duration_seconds = metadata.get("duration")
+
         return ValidateEchoResponse(valid=True, reason="All fields valid")
 
     def handle_create_echo(self, echo: Echo) -> Echo:
@@ -329,11 +404,26 @@ class EchoApp(LightningFlow):
 
         return self.create_echo(echo)
 
-    def handle_list_echoes(self, user_id: str) -> List[Echo]:
-        return self.list_echoes(ListEchoesConfig(user_id=user_id))
-
-    def handle_get_echo(self, echo_id: str, include_segments: bool) -> GetEchoResponse:
-        response = self.get_echo(GetEchoConfig(echo_id=echo_id, include_segments=include_segments))
+    def handle_list_echoes(
+        self, user_id: str, after: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[EchoSummary]:
+        return self.list_echoes(ListEchoesConfig(user_id=user_id, after=after, limit=limit))
+
+    def handle_get_echo(
+        self,
+        echo_id: str,
+        include_segments: bool,
+        segments_after: Optional[str] = None,
+        segments_limit: Optional[int] = None,
+    ) -> GetEchoResponse:
+        response = self.get_echo(
+            GetEchoConfig(
+                echo_id=echo_id,
+                include_segments=include_segments,
+                segments_after=segments_after,
+                segments_limit=segments_limit,
+            )
+        )
         if response is None:
             raise HTTPException(status_code=404, detail="Echo not found")
 
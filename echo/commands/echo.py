@@ -2,15 +2,18 @@ import json
 import mimetypes
 import os
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from uuid import uuid4
 
 import requests
 from lightning.app.core.constants import APP_SERVER_HOST, APP_SERVER_PORT
 from lightning.app.utilities.commands import ClientCommand
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from echo.authn.session import CREDENTIALS_FILENAME
-from echo.models.echo import DeleteEchoConfig, Echo, GetEchoConfig, ListEchoesConfig
+from echo.models.echo import DeleteEchoConfig, Echo, EchoSummary, GetEchoConfig, ListEchoesConfig
 
 SUPPORTED_AUDIO_MEDIA_TYPES = [
     "audio/wav",
@@ -22,6 +25,10 @@ SUPPORTED_AUDIO_MEDIA_TYPES = [
     "audio/mpeg",
 ]
 SUPPORTED_VIDEO_MEDIA_TYPES = ["video/mp4"]
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_CONCURRENCY = 4
+# Failed chunks are retried on their own, so a dropped connection does not restart the whole upload
+UPLOAD_CHUNK_RETRIES = 5
 
 
 class CreateEcho(ClientCommand):
@@ -33,16 +40,45 @@ class CreateEcho(ClientCommand):
         if "localhost" in base_url:
             base_url = f"{APP_SERVER_HOST}:{APP_SERVER_PORT}"
 
-        # Upload audio file to fileserver
-        with open(file, "rb") as f:
-            data = f.read()
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            max_retries=Retry(
+                total=UPLOAD_CHUNK_RETRIES,
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET", "PUT"],
+            ),
+            pool_maxsize=UPLOAD_CONCURRENCY,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        upload_url = f"{base_url}/uploads/{echo_id}"
+        print(f"Uploading audio file to fileserver: {upload_url}")
+
+        # Upload audio file to fileserver in chunks, skipping the ones it already has if the upload is resumed
+        size = os.path.getsize(file)
+        response = session.post(upload_url, params={"size": size, "chunk_size": UPLOAD_CHUNK_SIZE})
+        assert response.status_code == 200, f"Failed to start upload: {response.text}"
+        upload = response.json()
+        missing = sorted(set(range(upload["chunk_count"])) - set(upload["received"]))
+
+        def upload_chunk(index: int):
+            # Each worker reads through a handle of its own, as they would race on the position of a shared one
+            with open(file, "rb") as f:
+                f.seek(index * UPLOAD_CHUNK_SIZE)
+                data = f.read(UPLOAD_CHUNK_SIZE)
+
+            response = session.put(f"{upload_url}/chunks/{index}", data=data)
+            assert response.status_code == 200, f"Failed to upload chunk {index}: {response.text}"
 
-            print(f"Uploading audio file to fileserver: {base_url}/upload/{echo_id}")
+        with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+            list(executor.map(upload_chunk, missing))
 
-            response = requests.put(url=f"{base_url}/upload/{echo_id}", files={"file": data})
-            assert response.status_code == 200, f"Failed to upload file: {response.text}"
+        response = session.post(f"{upload_url}/finalize")
+        assert response.status_code == 200, f"Failed to upload file: {response.text}"
 
-            print(f"Completed upload of audio file to fileserver: {base_url}/upload/{echo_id}")
+        print(f"Completed upload of audio file to fileserver: {upload_url}")
 
     def run(self):
         parser = ArgumentParser(description="Create an Echo")
@@ -94,9 +130,17 @@ class CreateEcho(ClientCommand):
 
 class ListEchoes(ClientCommand):
     def run(self):
+        parser = ArgumentParser(description="List Echoes")
+        parser.add_argument("--after", type=str, default=None, required=False, help="Cursor of the last Echo listed")
+        parser.add_argument("--limit", type=int, default=None, required=False)
+
+        args = parser.parse_args()
+
         user_id = get_user_id()
 
-        response: List[Echo] = self.invoke_handler(config=ListEchoesConfig(user_id=user_id))
+        response: List[EchoSummary] = self.invoke_handler(
+            config=ListEchoesConfig(user_id=user_id, after=args.after, limit=args.limit)
+        )
         print(json.dumps(response, indent=4))
 
 
@@ -6,7 +6,7 @@ from requests.adapters import HTTPAdapter
 from sqlmodel import SQLModel
 from urllib3.util.retry import Retry
 
-from echo.models.echo import Echo
+from echo.models.echo import Echo, EchoSummary
 from echo.models.general import GeneralModel
 from echo.models.segment import Segment
 
@@ -44,17 +44,41 @@ class DatabaseClient:
         self.general_endpoint = db_url + "/general/"
         self.session = _configure_session()
 
-    def list_echoes(self, user_id: Optional[str] = None, created_before: Optional[int] = None) -> List[Echo]:
-        endpoint = f"{self.db_url}/echoes/"
+    def list_echoes(
+        self,
+        user_id: Optional[str] = None,
+        created_before: Optional[int] = None,
+        after: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Echo]:
+        """Lists Echoes from newest to oldest. Pass the `cursor` of the last Echo of a page as `after` to get the next
+        one."""
+        params = {"user_id": user_id, "created_before": created_before, "after": after, "limit": limit}
+
+        resp = self.session.get(f"{self.db_url}/echoes/", params=params)
+        assert resp.status_code == 200
+        return [self.model(**data) for data in resp.json()]
 
-        if user_id is not None:
-            endpoint += f"?user_id={user_id}"
-        if created_before is not None:
-            endpoint += f"{'?' if user_id is None else '&'}created_before={created_before}"
+    def list_echo_summaries(
+        self,
+        user_id: Optional[str] = None,
+        created_before: Optional[int] = None,
+        after: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[EchoSummary]:
+        """Same as `list_echoes`, but without the transcripts."""
+        params = {"user_id": user_id, "created_before": created_before, "after": after, "limit": limit}
+
+        resp = self.session.get(f"{self.db_url}/echoes/summaries/", params=params)
+        assert resp.status_code == 200
+        return [EchoSummary(**data) for data in resp.json()]
 
-        resp = self.session.get(endpoint)
+    def count_echoes(self, user_id: Optional[str] = None, created_before: Optional[int] = None) -> int:
+        params = {"user_id": user_id, "created_before": created_before}
+
+        resp = self.session.get(f"{self.db_url}/echoes/count", params=params)
         assert resp.status_code == 200
-        return [self.model(**data) for data in resp.json()]
+        return resp.json()
 
     def get_echo(self, echo_id: str) -> Optional[Echo]:
         resp = self.session.get(f"{self.db_url}/echoes/{echo_id}")
@@ -62,21 +86,34 @@ class DatabaseClient:
         obj = resp.json()
         return self.model(**obj) if obj else None
 
-    def list_segments_for_echo(self, echo_id: str) -> List[Segment]:
-        resp = self.session.get(f"{self.db_url}/segments/?echo_id={echo_id}")
+    def list_segments_for_echo(
+        self, echo_id: str, after: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[Segment]:
+        params = {"echo_id": echo_id, "after": after, "limit": limit}
+
+        resp = self.session.get(f"{self.db_url}/segments/", params=params)
         assert resp.status_code == 200
         return [self.model(**data) for data in resp.json()]
 
-    def create_segments_for_echo(self, segments: List[Segment]):
+    def create_segments_for_echo(self, segments: List[Segment]) -> bool:
+        """Saves the segments of an Echo, returning `False` if the Echo does not exist (anymore)."""
         resp = self.session.post(f"{self.db_url}/segments", json=[s.dict() for s in segments])
+        if resp.status_code == 404:
+            return False
         assert resp.status_code == 200
-        return None
+        return True
 
     def delete_echo(self, echo_id: str) -> None:
         resp = self.session.delete(f"{self.db_url}/echoes/{echo_id}")
         assert resp.status_code == 200
         return None
 
+    def delete_echoes(self, echo_ids: List[str]) -> None:
+        """Deletes many Echoes (along with their segments) at once."""
+        resp = self.session.post(f"{self.db_url}/echoes/delete", json=echo_ids)
+        assert resp.status_code == 200
+        return None
+
     def delete_segments_for_echo(self, echo_id: str) -> None:
         resp = self.session.delete(f"{self.db_url}/segments/?echo_id={echo_id}")
         assert resp.status_code == 200
@@ -89,9 +126,13 @@ class DatabaseClient:
         )
         assert resp.status_code == 200
 
-    def put(self, config: SQLModel):
+    def put(self, config: SQLModel) -> bool:
+        """Updates an existing row, returning `False` if it does not exist (anymore)."""
         resp = self.session.put(
             self.general_endpoint,
             data=GeneralModel.from_obj(config).json(),
         )
+        if resp.status_code == 404:
+            return False
         assert resp.status_code == 200
+        return True
@@ -0,0 +1,64 @@
+from typing import Callable, List
+
+from lightning.app.utilities.app_helpers import Logger
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+logger = Logger(__name__)
+
+
+def add_missing_columns(connection: Connection):
+    """Adds columns which were introduced after a table was first created, since `create_all` skips existing tables."""
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                logger.info(f"Adding missing column {table.name}.{column.name}")
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def create_indexes(connection: Connection):
+    """Creates the indexes declared on the tables, which `create_all` skips for existing tables as well."""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            logger.info(f"Creating index {index.name} on {table.name}")
+            index.create(connection, checkfirst=True)
+
+
+# NOTE: Only ever append to this list, the position of each migration is its schema version. Every schema change
+# needs a migration of its own, since existing databases only run the ones after their version, e.g. columns added to
+# a model later are only added to them by appending `add_missing_columns` again
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    add_missing_columns,
+    create_indexes,
+]
+
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine: Engine, migrations: List[Callable[[Connection], None]] = MIGRATIONS):
+    """Upgrades the database in place by running the migrations it has not seen yet, each in its own transaction.
+
+    The schema version is stored in the database file itself (as SQLite's `user_version`).
+    """
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+
+    for target_version, migration in enumerate(migrations[version:], start=version + 1):
+        logger.info(f"Migrating database to version {target_version} ({migration.__name__})")
+        try:
+            with engine.begin() as connection:
+                migration(connection)
+                # NOTE: Pragmas do not support bound parameters
+                connection.execute(text(f"PRAGMA user_version = {int(target_version)}"))
+        except Exception:
+            logger.error(f"Failed to migrate database to version {target_version} ({migration.__name__})")
+            raise
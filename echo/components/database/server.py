@@ -1,81 +1,192 @@
+import contextlib
 import os
 import pathlib
 from datetime import datetime
-from typing import List, Optional, Type
+from typing import Iterator, List, Optional, Type
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import Body, FastAPI, HTTPException
 from lightning import BuildConfig, CloudCompute, LightningWork
 from lightning.app.storage import Path
 from lightning.app.utilities.app_helpers import Logger
+from sqlalchemy import delete, event, exists, func, insert, tuple_
 from sqlmodel import Session, SQLModel, select
 
-from echo.models.echo import Echo
+from echo.components.database.migrations import migrate
+from echo.models.echo import Echo, EchoBase, EchoSummary, echo_cursor
 from echo.models.general import GeneralModel
 from echo.models.segment import Segment
-from echo.models.utils import get_primary_key
+from echo.models.utils import decode_cursor, get_primary_key
 from echo.monitoring.sentry import init_sentry
+from echo.utils.lock import FairLock
 
 logger = Logger(__name__)
 
 
 DEFAULT_CLOUD_COMPUTE = "cpu"
-
+DEFAULT_READ_POOL_SIZE = 8
+# Older versions of SQLite allow at most 999 bound parameters per statement
+MAX_PARAMETERS_PER_STATEMENT = 500
+# With WAL, readers never block the writer (and vice versa), and `NORMAL` only syncs to disk at checkpoints
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # Milliseconds to wait for a lock held by another connection (e.g. a checkpoint) before failing
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are in KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+# NOTE: SQLite allows a single writer at a time, so writes take turns (in the order they arrive) on the only connection
+# of the writer engine instead of contending for the database lock, while reads use a pool of their own
 engine = None
+read_engine = None
+write_lock = FairLock()
+
+
+def _filter_echoes(statement, user_id: Optional[str], created_before: Optional[int]):
+    if user_id:
+        statement = statement.where(Echo.user_id == user_id)
+    if created_before:
+        statement = statement.where(Echo.created_at < datetime.fromtimestamp(created_before))
 
+    return statement
 
-def list_echoes(user_id: Optional[str] = None, created_before: Optional[int] = None):
-    with Session(engine) as session:
-        statement = select(Echo)
-        if user_id:
-            statement = statement.where(Echo.user_id == user_id)
-        if created_before:
-            statement = statement.where(Echo.created_at < datetime.fromtimestamp(created_before))
 
+def _decode_cursor(cursor: str, count: int) -> List:
+    try:
+        return decode_cursor(cursor, count)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page_echoes(statement, after: Optional[str], limit: Optional[int]):
+    """Pages from newest to oldest, starting after the Echo with the `after` cursor (if given).
+
+    Paging with a cursor (instead of an offset) lets the database seek straight to the next page using the index.
+    """
+    if after is not None:
+        created_at, echo_id = _decode_cursor(after, 2)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(tuple_(Echo.created_at, Echo.id) < tuple_(created_at, echo_id))
+
+    # The ID breaks ties between Echoes created at the same time, so that pages never overlap
+    return statement.order_by(Echo.created_at.desc(), Echo.id.desc()).limit(limit)
+
+
+def list_echoes(
+    user_id: Optional[str] = None,
+    created_before: Optional[int] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+):
+    with Session(read_engine) as session:
+        statement = _page_echoes(_filter_echoes(select(Echo), user_id, created_before), after, limit)
         results = session.exec(statement)
         return results.all()
 
 
+def list_echo_summaries(
+    user_id: Optional[str] = None,
+    created_before: Optional[int] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[EchoSummary]:
+    """Same as `list_echoes`, but leaves out the transcripts which make up most of the size of an Echo."""
+    with Session(read_engine) as session:
+        columns = [getattr(Echo, name) for name in EchoBase.__fields__]
+        statement = _page_echoes(_filter_echoes(select(*columns), user_id, created_before), after, limit)
+        results = session.exec(statement)
+        return [EchoSummary(**row._mapping, cursor=echo_cursor(row.created_at, row.id)) for row in results]
+
+
+def count_echoes(user_id: Optional[str] = None, created_before: Optional[int] = None) -> int:
+    with Session(read_engine) as session:
+        statement = _filter_echoes(select(func.count()).select_from(Echo), user_id, created_before)
+        return session.exec(statement).one()
+
+
 def get_echo(echo_id: str):
-    with Session(engine) as session:
+    with Session(read_engine) as session:
         statement = select(Echo).where(Echo.id == echo_id)
         results = session.exec(statement)
         return results.first()
 
 
-def list_segments_for_echo(echo_id: str):
-    with Session(engine) as session:
-        statement = select(Segment).where(Segment.echo_id == echo_id).order_by(Segment.start)
+def list_segments_for_echo(echo_id: str, after: Optional[str] = None, limit: Optional[int] = None):
+    """Lists the segments of an Echo in order, starting after the segment with the `after` cursor (if given)."""
+    with Session(read_engine) as session:
+        statement = select(Segment).where(Segment.echo_id == echo_id)
+        if after is not None:
+            start, segment_id = _decode_cursor(after, 2)
+            statement = statement.where(tuple_(Segment.start, Segment.id) > tuple_(start, segment_id))
+
+        statement = statement.order_by(Segment.start, Segment.id).limit(limit)
         results = session.exec(statement)
         return results.all()
 
 
+@contextlib.contextmanager
+def write_session() -> Iterator[Session]:
+    """Opens a session on the writer engine once all writes which were waiting before are done.
+
+    The pool of the writer engine does not hand out its connection in order, so that under load a write could wait
+    for longer than any request is allowed to take.
+    """
+    with write_lock, Session(engine) as session:
+        yield session
+
+
 def delete_echo(echo_id: str):
-    with Session(engine) as session:
-        statement = select(Echo).where(Echo.id == echo_id)
-        results = session.exec(statement)
-        result = results.one()
-        session.delete(result)
+    delete_echoes([echo_id])
+
+
+def delete_echoes(echo_ids: List[str] = Body(...)):
+    """Deletes Echoes along with their segments in a single transaction.
+
+    Deleting is idempotent, e.g. the garbage collector may race with a user deleting the same Echo.
+    """
+    with write_session() as session:
+        for start in range(0, len(echo_ids), MAX_PARAMETERS_PER_STATEMENT):
+            batch = echo_ids[start : start + MAX_PARAMETERS_PER_STATEMENT]
+            # NOTE: Existing tables have no `ON DELETE CASCADE`, so the segments are deleted explicitly
+            session.execute(delete(Segment).where(Segment.echo_id.in_(batch)))
+            session.execute(delete(Echo).where(Echo.id.in_(batch)))
         session.commit()
 
 
 def create_segments_for_echo(segments: List[Segment]):
-    with Session(engine) as session:
-        session.add_all(segments)
+    """Saves the segments of Echoes, unless any of the Echoes does not exist (anymore).
+
+    The Echoes are looked up in the same transaction as the insert, so segments are never saved for an Echo which is
+    deleted concurrently (writes never overlap, see `write_session`).
+    """
+    if len(segments) == 0:
+        return
+
+    with write_session() as session:
+        for echo_id in {segment.echo_id for segment in segments}:
+            if not session.exec(select(exists().where(Echo.id == echo_id))).one():
+                raise HTTPException(status_code=404, detail="Echo not found")
+
+        # Inserting plain rows with `executemany` skips the unit of work of the ORM
+        session.execute(insert(Segment), [segment.dict() for segment in segments])
         session.commit()
 
 
 def delete_segments_for_echo(echo_id: str):
-    with Session(engine) as session:
-        statement = select(Segment).where(Segment.echo_id == echo_id)
-        results = session.exec(statement)
-        for result in results:
-            session.delete(result)
+    with write_session() as session:
+        session.execute(delete(Segment).where(Segment.echo_id == echo_id))
         session.commit()
 
 
 def general_post(config: GeneralModel):
-    with Session(engine) as session:
+    with write_session() as session:
         data = config.convert_to_model()
         session.add(data)
         session.commit()
@@ -84,13 +195,15 @@ def general_post(config: GeneralModel):
 
 
 def general_put(config: GeneralModel):
-    with Session(engine) as session:
+    with write_session() as session:
         update_data = config.convert_to_model()
         primary_key = get_primary_key(update_data.__class__)
         identifier = getattr(update_data.__class__, primary_key, None)
         statement = select(update_data.__class__).where(identifier == getattr(update_data, primary_key))
         results = session.exec(statement)
-        result = results.one()
+        result = results.first()
+        if result is None:
+            raise HTTPException(status_code=404, detail="Not found")
         for k, v in vars(update_data).items():
             if k in ("id", "_sa_instance_state"):
                 continue
@@ -101,12 +214,30 @@ def general_put(config: GeneralModel):
         session.refresh(result)
 
 
-def create_engine(db_file_name: str, models: List[Type[SQLModel]], echo: bool):
-    global engine
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def create_engine(
+    db_file_name: str, models: List[Type[SQLModel]], echo: bool, read_pool_size: int = DEFAULT_READ_POOL_SIZE
+):
+    global engine, read_engine, write_lock
 
     from sqlmodel import SQLModel, create_engine
 
-    engine = create_engine(f"sqlite:///{pathlib.Path(db_file_name).resolve()}", echo=echo)
+    url = f"sqlite:///{pathlib.Path(db_file_name).resolve()}"
+    # Pooled connections are used by whichever thread of the server handles a request
+    connect_args = {"check_same_thread": False}
+    engine = create_engine(url, echo=echo, connect_args=connect_args, pool_size=1, max_overflow=0)
+    read_engine = create_engine(
+        url, echo=echo, connect_args=connect_args, pool_size=read_pool_size, max_overflow=read_pool_size
+    )
+    write_lock = FairLock()
+    for pooled_engine in [engine, read_engine]:
+        event.listen(pooled_engine, "connect", set_sqlite_pragmas)
 
     logger.debug(f"Creating the following tables {models}")
     try:
@@ -114,6 +245,29 @@ def create_engine(db_file_name: str, models: List[Type[SQLModel]], echo: bool):
     except Exception as e:
         logger.debug(e)
 
+    # NOTE: Failures are not caught, as queries against a partially migrated schema would fail anyway
+    migrate(engine)
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    app.get("/echoes/")(list_echoes)
+    # NOTE: Must be added before `/echoes/{echo_id}`, which would match them as well
+    app.get("/echoes/summaries/")(list_echo_summaries)
+    app.get("/echoes/count")(count_echoes)
+    app.get("/echoes/{echo_id}")(get_echo)
+    app.get("/segments/")(list_segments_for_echo)
+    app.delete("/echoes/{echo_id}")(delete_echo)
+    app.post("/echoes/delete")(delete_echoes)
+    app.post("/segments")(create_segments_for_echo)
+    app.delete("/segments/")(delete_segments_for_echo)
+
+    app.post("/general/")(general_post)
+    app.put("/general/")(general_put)
+
+    return app
+
 
 class Database(LightningWork):
     def __init__(
@@ -136,21 +290,9 @@ class Database(LightningWork):
         self._models = models
 
     def run(self):
-        app = FastAPI()
-
         create_engine(self.db_file_name, self._models, self.debug)
 
-        app.get("/echoes/")(list_echoes)
-        app.get("/echoes/{echo_id}")(get_echo)
-        app.get("/segments/")(list_segments_for_echo)
-        app.delete("/echoes/{echo_id}")(delete_echo)
-        app.post("/segments")(create_segments_for_echo)
-        app.delete("/segments/")(delete_segments_for_echo)
-
-        app.post("/general/")(general_post)
-        app.put("/general/")(general_put)
-
-        uvicorn.run(app, host=self.host, port=self.port, log_level="error")
+        uvicorn.run(create_app(), host=self.host, port=self.port, log_level="error")
 
     def alive(self):
         """Hack: Returns whether the server is alive."""
@@ -1,25 +1,41 @@
+import hashlib
+import io
 import json
 import os
 import subprocess
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, BinaryIO, Callable, Dict, Mapping, Optional, Set
 
-import magic
 import uvicorn
-from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi import FastAPI, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
 from lightning import BuildConfig, CloudCompute, LightningWork
 from lightning.app.storage import Drive
 from lightning.app.utilities.app_helpers import Logger
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
 from echo.media.mime import UNSUPPORTED_MEDIA_TYPES, get_mimetype
+from echo.media.audio import PCM_EXTENSION, PCM_FORMAT, SAMPLE_RATE, decode_pcm
+from echo.media.video import probe_media
 from echo.monitoring.sentry import init_sentry
+from echo.utils.cache import FileCache
+from echo.utils.http import file_response, make_etag
 
 logger = Logger(__name__)
 
 
 DEFAULT_CLOUD_COMPUTE = "cpu-small"
-DEFAULT_CHUNK_SIZE = 10240
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# Progress is kept for the most recent uploads only
+MAX_TRACKED_UPLOADS = 1024
+MAX_UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_CACHE_MAX_SIZE_MB = 4096
+# Metadata is loaded back from the Drive when needed, so only the most recently used is kept in memory
+MAX_INDEXED_FILES = 10000
 
 
 @dataclass
@@ -31,6 +47,85 @@ class CustomBuildConfig(BuildConfig):
         ]
 
 
+@dataclass
+class UploadProgress:
+    received: int = 0
+    total: Optional[int] = None
+    done: bool = False
+
+
+def copy_file(src: BinaryIO, dst: BinaryIO, on_progress: Callable[[int], None], buffer_size: int = DEFAULT_BUFFER_SIZE):
+    """Copies the rest of a file into another one, without copying through Python if both are files on disk."""
+    # NOTE: `SpooledTemporaryFile` (used for uploads) wraps either a file on disk or an in-memory buffer
+    src = getattr(src, "_file", src)
+
+    try:
+        in_fd, out_fd = src.fileno(), dst.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        in_fd, out_fd = None, None
+
+    if in_fd is not None and hasattr(os, "sendfile"):
+        offset = src.tell()
+        try:
+            while True:
+                sent = os.sendfile(out_fd, in_fd, offset, buffer_size)
+                if sent == 0:
+                    return
+                offset += sent
+                on_progress(sent)
+        except OSError:
+            # Some platforms only support sending to sockets, so continue with regular reads
+            src.seek(offset)
+
+    buffer = memoryview(bytearray(buffer_size))
+    while True:
+        size = src.readinto(buffer)
+        if not size:
+            return
+        dst.write(buffer[:size])
+        on_progress(size)
+
+
+def hash_file(filepath: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> str:
+    """Returns the SHA-256 hash of the content of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        buffer = memoryview(bytearray(buffer_size))
+        size = f.readinto(buffer)
+        while size:
+            digest.update(buffer[:size])
+            size = f.readinto(buffer)
+
+    return digest.hexdigest()
+
+
+@dataclass
+class UploadSession:
+    """An upload split into chunks of `chunk_size` bytes (except the last one), which can arrive in any order."""
+
+    size: int
+    chunk_size: int
+    received: Set[int]
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def missing(self) -> Set[int]:
+        return set(range(self.chunk_count)) - self.received
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "chunk_count": self.chunk_count,
+            "received": sorted(self.received),
+        }
+
+
 class FileServer(LightningWork):
     def __init__(
         self,
@@ -50,14 +145,29 @@ class FileServer(LightningWork):
 
         self.drive = drive
         self.base_dir = base_dir
-        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self.buffer_size = DEFAULT_BUFFER_SIZE
+
+        # Local copies of the files on the Drive, which are fetched when they are downloaded
+        self.cache_max_size_mb = int(os.environ.get("ECHO_FILESERVER_CACHE_MAX_SIZE_MB", DEFAULT_CACHE_MAX_SIZE_MB))
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self._cache: Optional[FileCache] = None
 
         # Pre-shared secret that prevents unauthorized deletion of files
         self._auth_token = auth_token
 
         os.makedirs(self.base_dir, exist_ok=True)
 
-        self.uploaded_files = dict()
+        # NOTE: Progress is private, since updating Work state for every buffer would flood the state sync
+        self._uploads: "OrderedDict[str, UploadProgress]" = OrderedDict()
+        self._uploads_lock = threading.Lock()
+        # Chunked uploads which have not been finalized yet
+        self._sessions: Dict[str, UploadSession] = {}
+
+        # Index of the metadata of the stored files, which is persisted as `.meta` files on the Drive
+        self._metadata: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._metadata_lock = threading.Lock()
 
     def run(self):
         app = FastAPI()
@@ -72,13 +182,47 @@ class FileServer(LightningWork):
 
         @app.put("/upload/{echo_id}")
         def upload_file(echo_id: str, file: UploadFile):
-            """Upload a file directly as form data."""
+            """Upload a file directly as form data.
+
+            NOTE: Sync handlers run in a threadpool, so copying large files does not block the event loop.
+            """
             return self.upload_file(echo_id, file)
 
+        @app.get("/upload/{echo_id}/progress")
+        def get_upload_progress(echo_id: str):
+            """Get how much of the file for a specific Echo has been received."""
+            return self.get_upload_progress(echo_id)
+
+        @app.post("/uploads/{echo_id}")
+        def create_upload_session(echo_id: str, size: int, chunk_size: int):
+            """Start (or resume) an upload of a file in chunks, which can be sent in parallel."""
+            return self.create_upload_session(echo_id, size, chunk_size)
+
+        @app.get("/uploads/{echo_id}")
+        def get_upload_session(echo_id: str):
+            """Get which chunks of a chunked upload have been received."""
+            return self.get_upload_session(echo_id)
+
+        @app.put("/uploads/{echo_id}/chunks/{index}")
+        async def upload_chunk(echo_id: str, index: int, request: Request):
+            """Upload a single chunk as the raw request body."""
+            data = await request.body()
+            return await run_in_threadpool(self.upload_chunk, echo_id, index, data)
+
+        @app.post("/uploads/{echo_id}/finalize")
+        def finalize_upload_session(echo_id: str):
+            """Assemble a chunked upload once all of its chunks have been received."""
+            return self.finalize_upload_session(echo_id)
+
         @app.get("/download/{echo_id}")
-        def download_file(echo_id: str):
-            """Download a file for a specific Echo."""
-            return self.download_file(echo_id)
+        def download_file(echo_id: str, request: Request):
+            """Download a file (or byte ranges of it) for a specific Echo."""
+            return self.download_file(echo_id, request.headers)
+
+        @app.get("/metadata/{echo_id}")
+        def get_metadata(echo_id: str):
+            """Get the metadata (size, duration, etc) of the file for a specific Echo."""
+            return self.get_metadata(echo_id)
 
         @app.post("/delete/{echo_id}")
         def delete_file(echo_id: str, auth_token: str):
@@ -90,21 +234,121 @@ class FileServer(LightningWork):
         """Hack: Returns whether the server is alive."""
         return self.url != ""
 
+    def _track_upload(self, echo_id: str) -> UploadProgress:
+        with self._uploads_lock:
+            progress = self._uploads[echo_id] = UploadProgress()
+            while len(self._uploads) > MAX_TRACKED_UPLOADS:
+                self._uploads.popitem(last=False)
+
+        return progress
+
+    def get_upload_progress(self, echo_id: str) -> Dict[str, Any]:
+        with self._uploads_lock:
+            progress = self._uploads.get(echo_id)
+
+        if progress is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+        return asdict(progress)
+
     def upload_file(self, echo_id: str, file: UploadFile):
         """Upload a file while tracking its progress."""
-        self.uploaded_files[echo_id] = {"progress": (0, None), "done": False}
+        progress = self._track_upload(echo_id)
+
+        file.file.seek(0, os.SEEK_END)
+        progress.total = file.file.tell()
+        file.file.seek(0)
+
+        def on_progress(size: int):
+            progress.received += size
 
-        # Save file to shared Drive
+        # The upload replaces the local copy of a previous upload of the same file
+        self._get_cache().discard(echo_id)
         filepath = self._get_filepath(echo_id)
         with open(filepath, "wb") as out_file:
-            content = file.file.read(self.chunk_size)
-            while content:
-                size = out_file.write(content)
-                self.uploaded_files[echo_id]["progress"] = (
-                    self.uploaded_files[echo_id]["progress"][0] + size,
-                    None,
-                )
-                content = file.file.read(self.chunk_size)
+            copy_file(file.file, out_file, on_progress=on_progress, buffer_size=self.buffer_size)
+
+        return self._save_file(echo_id, progress)
+
+    def create_upload_session(self, echo_id: str, size: int, chunk_size: int) -> Dict[str, Any]:
+        if size < 0 or not 0 < chunk_size <= MAX_UPLOAD_CHUNK_SIZE:
+            raise HTTPException(status_code=400, detail="Invalid size or chunk size")
+
+        with self._uploads_lock:
+            session = self._sessions.get(echo_id)
+            # Resume the existing upload unless the file to upload is a different one
+            if session is not None and session.size == size and session.chunk_size == chunk_size:
+                return session.status()
+
+            session = self._sessions[echo_id] = UploadSession(size=size, chunk_size=chunk_size, received=set())
+
+        progress = self._track_upload(echo_id)
+        progress.total = size
+
+        # Chunks are written in place, so the file never needs to be assembled from separate parts
+        with open(self._get_partial_filepath(echo_id), "wb") as f:
+            f.truncate(size)
+
+        return session.status()
+
+    def get_upload_session(self, echo_id: str) -> Dict[str, Any]:
+        session = self._sessions.get(echo_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+        return session.status()
+
+    def upload_chunk(self, echo_id: str, index: int, data: bytes) -> Dict[str, Any]:
+        session = self._sessions.get(echo_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if not 0 <= index < session.chunk_count or len(data) != session.chunk_length(index):
+            raise HTTPException(status_code=400, detail="Invalid chunk")
+
+        fd = os.open(self._get_partial_filepath(echo_id), os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            offset = index * session.chunk_size
+            while len(view) > 0:
+                written = os.pwrite(fd, view, offset)
+                view, offset = view[written:], offset + written
+        finally:
+            os.close(fd)
+
+        with self._uploads_lock:
+            is_new = index not in session.received
+            session.received.add(index)
+            progress = self._uploads.get(echo_id)
+            if is_new and progress is not None:
+                progress.received += len(data)
+
+        return {"index": index, "size": len(data)}
+
+    def finalize_upload_session(self, echo_id: str) -> Dict[str, Any]:
+        session = self._sessions.get(echo_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+
+        missing = session.missing()
+        if len(missing) > 0:
+            raise HTTPException(status_code=409, detail=f"Missing chunks: {sorted(missing)}")
+
+        with self._uploads_lock:
+            if self._sessions.pop(echo_id, None) is None:
+                raise HTTPException(status_code=409, detail="Upload is already being finalized")
+            progress = self._uploads.get(echo_id)
+        if progress is None:
+            progress = self._track_upload(echo_id)
+
+        self._get_cache().discard(echo_id)
+        os.replace(self._get_partial_filepath(echo_id), self._get_filepath(echo_id))
+        progress.received = session.size
+
+        return self._save_file(echo_id, progress)
+
+    def _save_file(self, echo_id: str, progress: UploadProgress) -> Dict[str, Any]:
+        """Converts an uploaded file if needed, then saves it along with its metadata to the shared Drive."""
+        filepath = self._get_filepath(echo_id)
 
         if get_mimetype(filepath) in UNSUPPORTED_MEDIA_TYPES:
             # TODO: Handle exceptions from `ffmpeg`
@@ -115,53 +359,162 @@ class FileServer(LightningWork):
             os.remove(filepath)
             os.rename(f"{filepath}.mp3", filepath)
 
+        meta = self._describe_file(echo_id, filepath)
         self.drive.put(self._get_drive_filepath(echo_id))
+
+        # Decode the audio once here, so speech recognition can use it without decoding or probing the media again
+        meta["audio"] = self._save_audio(echo_id) if meta["has_audio"] else None
         os.remove(filepath)
 
-        full_size = self.uploaded_files[echo_id]["progress"][0]
-        self.uploaded_files[echo_id] = {
-            "progress": (full_size, full_size),
-            "done": True,
-            "uploaded_file": echo_id,
-        }
+        progress.done = True
+        self._save_metadata(echo_id, meta)
 
-        # Save metadata file to shared Drive
-        meta_file = echo_id + ".meta"
-        meta = {
+        return meta
+
+    def _describe_file(self, echo_id: str, filepath: str) -> Dict[str, Any]:
+        """Inspects a stored file, which is only done once per file since the result is saved in the index."""
+        try:
+            probe = probe_media(filepath)
+        except Exception as e:
+            logger.warn(f"Could not probe {echo_id}: {e}")
+            probe = {"duration": None, "streams": None, "has_audio": None}
+
+        audio_codecs = [stream["codec_name"] for stream in probe["streams"] or [] if stream["codec_type"] == "audio"]
+
+        return {
             "original_path": echo_id,
             "display_name": os.path.splitext(echo_id)[0],
-            "size": full_size,
+            "size": os.path.getsize(filepath),
             "drive_path": echo_id,
+            "mimetype": get_mimetype(filepath),
+            "sha256": hash_file(filepath, buffer_size=self.buffer_size),
+            "codec": audio_codecs[0] if len(audio_codecs) > 0 else None,
+            # Unlike the modification time of a local copy, this stays the same whenever the file is fetched again
+            "uploaded_at": time.time(),
+            **probe,
         }
+
+    def _save_metadata(self, echo_id: str, meta: Dict[str, Any]):
+        """Adds the metadata of a file to the index and saves it to the shared Drive."""
+        self._index_metadata(echo_id, meta)
+
+        meta_file = echo_id + ".meta"
         with open(self._get_filepath(meta_file), "w") as f:
             json.dump(meta, f)
 
         self.drive.put(self._get_drive_filepath(meta_file))
         os.remove(self._get_filepath(meta_file))
 
+    def _index_metadata(self, echo_id: str, meta: Dict[str, Any]):
+        with self._metadata_lock:
+            self._metadata[echo_id] = meta
+            self._metadata.move_to_end(echo_id)
+            while len(self._metadata) > MAX_INDEXED_FILES:
+                self._metadata.popitem(last=False)
+
+    def _load_metadata(self, echo_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the metadata of a file from the index, loading it from the shared Drive if needed."""
+        with self._metadata_lock:
+            if echo_id in self._metadata:
+                self._metadata.move_to_end(echo_id)
+                return self._metadata[echo_id]
+
+        meta_file = echo_id + ".meta"
+        try:
+            self.drive.get(self._get_drive_filepath(meta_file), overwrite=True)
+            with open(self._get_filepath(meta_file)) as f:
+                meta = json.load(f)
+            os.remove(self._get_filepath(meta_file))
+        except Exception:
+            return None
+
+        self._index_metadata(echo_id, meta)
+
         return meta
 
-    def download_file(self, echo_id: str):
-        filepath = self._get_filepath(echo_id)
+    def _save_audio(self, echo_id: str) -> Optional[Dict[str, Any]]:
+        """Saves the audio of an uploaded file as 16 kHz mono PCM to the shared Drive."""
+        audio_file = echo_id + PCM_EXTENSION
+        try:
+            with open(self._get_filepath(audio_file), "wb") as f:
+                for buffer in decode_pcm(self._get_filepath(echo_id)):
+                    f.write(buffer)
+
+            self.drive.put(self._get_drive_filepath(audio_file))
+        except Exception as e:
+            logger.warn(f"Could not decode audio of {echo_id}: {e}")
+            return None
+        finally:
+            if os.path.exists(self._get_filepath(audio_file)):
+                os.remove(self._get_filepath(audio_file))
+
+        return {"path": audio_file, "format": PCM_FORMAT, "sample_rate": SAMPLE_RATE, "channels": 1}
+
+    def _get_cache(self) -> FileCache:
+        with self._uploads_lock:
+            if self._cache is None:
+                self._cache = FileCache(
+                    self.base_dir,
+                    max_size_bytes=self.cache_max_size_mb * 1024 * 1024,
+                    fetch=lambda echo_id: self.drive.get(self._get_drive_filepath(echo_id), overwrite=True),
+                )
 
-        if not os.path.exists(filepath):
-            try:
-                self.drive.get(self._get_drive_filepath(echo_id))
-            except Exception:
-                raise HTTPException(status_code=404, detail="File not found")
+        return self._cache
 
-        mimetype = magic.Magic(mime=True).from_file(filepath)
+    def download_file(self, echo_id: str, request_headers: Optional[Mapping[str, str]] = None):
+        cache = self._get_cache()
+        try:
+            filepath = cache.acquire(echo_id)
+        except Exception:
+            raise HTTPException(status_code=404, detail="File not found")
+        finally:
+            self.cache_hits, self.cache_misses, self.cache_evictions = cache.hits, cache.misses, cache.evictions
 
-        return FileResponse(path=filepath, filename=filepath, media_type=mimetype, headers={"Accept-Ranges": "bytes"})
+        # The file stays pinned in the cache until it was sent
+        try:
+            meta = self._load_metadata(echo_id)
+            # Files stored before their metadata was complete are described on first use
+            if meta is None or "sha256" not in meta or "uploaded_at" not in meta:
+                meta = {**(meta or {}), **self._describe_file(echo_id, filepath)}
+                self._save_metadata(echo_id, meta)
+
+            return file_response(
+                filepath,
+                request_headers or {},
+                media_type=meta["mimetype"],
+                etag=make_etag(meta["sha256"]),
+                last_modified=meta["uploaded_at"],
+                filename=filepath,
+                read_size=self.buffer_size,
+                background=BackgroundTask(cache.release, echo_id),
+            )
+        except Exception:
+            cache.release(echo_id)
+            raise
+
+    def get_metadata(self, echo_id: str) -> Dict[str, Any]:
+        meta = self._load_metadata(echo_id)
+        if meta is None:
+            raise HTTPException(status_code=404, detail="File not found")
+
+        return meta
 
     def delete_file(self, echo_id: str, auth_token: str):
         if auth_token != self._auth_token:
             raise HTTPException(status_code=401, detail="Unauthorized")
 
+        with self._metadata_lock:
+            self._metadata.pop(echo_id, None)
+        self._get_cache().discard(echo_id)
+
+        if self._sessions.pop(echo_id, None) is not None:
+            os.remove(self._get_partial_filepath(echo_id))
+
         try:
             # FIXME: There is a bug with `Drive.delete()` which does not work in the cloud
             self.drive.delete(self._get_drive_filepath(echo_id))
             self.drive.delete(self._get_drive_filepath(echo_id + ".meta"))
+            self.drive.delete(self._get_drive_filepath(echo_id + PCM_EXTENSION))
         except Exception:
             logger.warn(f"Could not delete file {echo_id} from Drive")
 
@@ -171,6 +524,10 @@ class FileServer(LightningWork):
 
         return os.path.join(directory, echo_id)
 
+    def _get_partial_filepath(self, echo_id: str):
+        """Returns file path of a chunked upload which has not been finalized yet."""
+        return self._get_filepath(f"{echo_id}.part")
+
     def _get_filepath(self, path: str):
         """Returns file path stored on the file server."""
         return os.path.join(self.base_dir, path)
@@ -1,7 +1,8 @@
 import time
 import uuid
+from dataclasses import dataclass, field
 from multiprocessing import Lock
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from lightning import LightningFlow, LightningWork
 from lightning.app.structures import Dict as LightningDict
@@ -13,11 +14,27 @@ from echo.utils.status import oldest_called, pending_calls
 DEFAULT_WORK_ATTRIBUTE_PREFIX = "loadbalanced_work_"
 DEFAULT_MAX_IDLE_SECONDS_PER_WORK = 120
 DEFAULT_MAX_PENDING_CALLS_PER_WORK = 10
+# Every second a call waits makes it as urgent as a call that is one second (of cost) shorter
+DEFAULT_AGING_RATE = 1.0
 
 
 logger = Logger(__name__)
 
 
+@dataclass
+class QueuedCall:
+    """A call to `run()` which is waiting for a Work with free capacity."""
+
+    cost: float
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    queued_at: float = field(default_factory=time.time)
+
+    def priority(self, aging_rate: float, now: float) -> float:
+        """Lower is more urgent: cheap calls go first, but expensive calls catch up the longer they wait."""
+        return self.cost - aging_rate * (now - self.queued_at)
+
+
 class LoadBalancer(LightningFlow):
     """Enables autoscaling and distribution of tasks to Works."""
 
@@ -28,12 +45,23 @@ class LoadBalancer(LightningFlow):
         max_idle_seconds_per_work=DEFAULT_MAX_IDLE_SECONDS_PER_WORK,
         create_work: Callable[[Any], LightningWork] = None,
         dummy_run_kwargs: Dict[str, Any] = {},
+        get_cost: Optional[Callable[..., float]] = None,
+        aging_rate: float = DEFAULT_AGING_RATE,
     ):
+        """Calls are queued and dispatched shortest job first once a Work has free capacity.
+
+        `get_cost` receives the arguments of each call and estimates how long it will take (e.g. the duration of the
+        media to transcribe). Without it, calls are dispatched in the order they arrive.
+        """
         super().__init__()
 
         self.max_pending_calls_per_work = max_pending_calls_per_work
         self.max_idle_seconds_per_work = max_idle_seconds_per_work
+        self.aging_rate = aging_rate
         self.workers = LightningDict()
+        # Number and total cost of the calls waiting for a Work with free capacity
+        self.queued_calls = 0
+        self.queued_cost = 0.0
 
         self._name = name
         self._work_attribute_prefix = f"{self._name}_" if self.name != "" else DEFAULT_WORK_ATTRIBUTE_PREFIX
@@ -41,6 +69,8 @@ class LoadBalancer(LightningFlow):
         self._work_pool: Dict[str, LightningWork] = {}
         self._create_work = create_work
         self._dummy_run_kwargs = dummy_run_kwargs
+        self._get_cost = get_cost
+        self._queue: List[QueuedCall] = []
 
     def _add_work(self):
         """Adds the given Work to the Flow using a unique attribute name."""
@@ -70,7 +100,39 @@ class LoadBalancer(LightningFlow):
         if not work.status.stage == WorkStageStatus.SUCCEEDED:
             return False
 
-        return (work.status.timestamp + self.max_idle_seconds_per_work) < time.time()
+        # Works which process calls in the background report busy slots even though `run()` has returned
+        if getattr(work, "free_slots", None) is not None and work.free_slots < work.slots:
+            return False
+
+        last_active = max(work.status.timestamp, getattr(work, "last_completed_at", 0))
+
+        return (last_active + self.max_idle_seconds_per_work) < time.time()
+
+    def _free_capacity(self, work: LightningWork) -> int:
+        """Estimates how many more calls a Work can start processing right away.
+
+        Works which report their free slots are routed on them, the others on the configured maximum number of pending
+        calls. Reported slots reach the Flow with a delay, so a Work may receive calls beyond its capacity, which wait
+        inside the Work until a slot frees up.
+        """
+        free_slots = getattr(work, "free_slots", None)
+        if free_slots is None:
+            return self.max_pending_calls_per_work - pending_calls(work)
+
+        # Works which prefetch their next calls accept a few more than they have slots for
+        return free_slots + getattr(work, "prefetch_depth", 0) - pending_calls(work)
+
+    def _pending_cost(self, work: LightningWork) -> float:
+        """Returns the cost of the calls a Work has accepted but not finished yet, if it reports it."""
+        return getattr(work, "pending_cost", 0.0)
+
+    def _dispatch_order(self, work: LightningWork) -> Tuple[bool, float]:
+        """Sorts the Works which are warmed up first, then the ones with the least work left."""
+        return not self._is_ready(work), self._pending_cost(work)
+
+    def _is_ready(self, work: LightningWork):
+        """Checks if a given Work reports that it is warmed up (Works without a readiness signal are always ready)."""
+        return getattr(work, "ready", True)
 
     def ensure_min_replicas(self, min_replicas: int):
         """Checks for idle Works and stops them to save on cloud costs."""
@@ -90,50 +152,71 @@ class LoadBalancer(LightningFlow):
                     self._remove_work(work_name)
 
     def run(self, *args, **kwargs):
-        with self._work_pool_rw_lock:
-            succeeded = [work for work in self.pool if work.status.stage == WorkStageStatus.SUCCEEDED]
-            running = [work for work in self.pool if work.status.stage == WorkStageStatus.RUNNING]
-            available = [work for work in running if pending_calls(work) < self.max_pending_calls_per_work]
-            pending = [
-                work
-                for work in self.pool
-                if work.status.stage in [WorkStageStatus.PENDING, WorkStageStatus.NOT_STARTED]
-            ]
-
-            # Try to use a previously succeeded Work first
-            for work in succeeded:
-                logger.info(f"Found succeeded Work ({work.name}), calling `run()`")
-                work.run(*args, **kwargs)
-                return
-
-            # Try to use a Work that is currently running and has not reached the max pending calls
-            if len(available) > 0:
-                oldest_called_work = oldest_called(available)
-                logger.info(f"Found running Work ({oldest_called_work.name}), calling `run()`")
-                oldest_called_work.run(*args, **kwargs)
-                return
-
-            # If all Works are at maximum capacity, check if we should trigger a scale up
-            if len(pending) == 0:
-                logger.info("No Works available, scaling up")
-                new_work = self._add_work()
-                logger.info(f"Scaling up, created new Work ({new_work.name})")
-                # NOTE: Calling `run()` with dummy args so that cloud machine is created
-                new_work.run(**self._dummy_run_kwargs)
+        """Queues a call to `run()` and dispatches it right away if there is a Work with free capacity."""
+        cost = self._get_cost(*args, **kwargs) if self._get_cost is not None else 0.0
+        self._queue.append(QueuedCall(cost=cost, args=args, kwargs=kwargs))
 
-                if len(running) == 0:
-                    logger.info(f"No other Works are running, calling `run()` on new Work ({new_work.name})")
-                    new_work.run(*args, **kwargs)
-                    return
+        self.dispatch()
 
-            # Find the Work with the least number of pending `run()` calls and use it
-            if len(running) > 0:
-                current_pending_calls = [(work, pending_calls(work)) for work in running]
-                least_overloaded = min(current_pending_calls, key=lambda work: work[1])
-                logger.info(f"Found least overloaded running Work ({least_overloaded[0].name}), calling `run()`")
-                least_overloaded[0].run(*args, **kwargs)
-            else:
-                current_pending_calls = [(work, pending_calls(work)) for work in pending]
-                least_overloaded = min(current_pending_calls, key=lambda work: work[1])
-                logger.info(f"Found least overloaded pending Work ({least_overloaded[0].name}), calling `run()`")
-                least_overloaded[0].run(*args, **kwargs)
+    def dispatch(self):
+        """Dispatches queued calls to Works with free capacity, the most urgent first, and scales up if needed.
+
+        Needs to be called regularly (e.g. from the parent Flow's `run()`), as Works free up capacity over time.
+        """
+        with self._work_pool_rw_lock:
+            while len(self._queue) > 0:
+                work = self._select_work()
+                if work is None:
+                    self._scale_up()
+                    break
+
+                now = time.time()
+                call = min(self._queue, key=lambda call: call.priority(self.aging_rate, now))
+                self._queue.remove(call)
+
+                logger.info(f"Dispatching call with cost {call.cost} to Work ({work.name})")
+                work.run(*call.args, **call.kwargs)
+
+            self.queued_calls = len(self._queue)
+            self.queued_cost = sum(call.cost for call in self._queue)
+
+    def _select_work(self) -> Optional[LightningWork]:
+        """Returns a Work which can start another call right away, or `None` if all of them are at capacity."""
+        succeeded = [work for work in self.pool if work.status.stage == WorkStageStatus.SUCCEEDED]
+        running = [work for work in self.pool if work.status.stage == WorkStageStatus.RUNNING]
+        pending = [
+            work for work in self.pool if work.status.stage in [WorkStageStatus.PENDING, WorkStageStatus.NOT_STARTED]
+        ]
+
+        # Try to use a previously succeeded Work with free capacity first (which may still be processing calls in the
+        # background)
+        available = [work for work in succeeded if self._free_capacity(work) > 0]
+        if len(available) > 0:
+            return min(available, key=self._dispatch_order)
+
+        # Try to use a running Work that has not reached its capacity
+        available = [work for work in running if self._free_capacity(work) > 0]
+        if len(available) > 0:
+            if any(hasattr(work, "pending_cost") for work in available):
+                return min(available, key=self._dispatch_order)
+            return oldest_called(available)
+
+        # Works which are still starting up queue calls until they are ready
+        available = [work for work in pending if self._free_capacity(work) > 0]
+        if len(available) > 0:
+            return min(available, key=pending_calls)
+
+        return None
+
+    def _scale_up(self):
+        """Adds a new Work unless one is already starting up."""
+        pending = [
+            work for work in self.pool if work.status.stage in [WorkStageStatus.PENDING, WorkStageStatus.NOT_STARTED]
+        ]
+        if len(pending) > 0:
+            return
+
+        new_work = self._add_work()
+        logger.info(f"No Works available, scaling up with new Work ({new_work.name})")
+        # NOTE: Calling `run()` with dummy args so that cloud machine is created
+        new_work.run(**self._dummy_run_kwargs)
@@ -1,24 +1,51 @@
+import json
 import os
-import subprocess
-import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import pysrt
 from lightning import BuildConfig, CloudCompute, LightningWork
 from lightning.app.storage import Drive
 from lightning.app.utilities.app_helpers import Logger
 
 from echo.components.database.client import DatabaseClient
+from echo.components.whisper import (
+    DEFAULT_THREADS_PER_SERVER,
+    ModelRegistry,
+    WhisperServerPool,
+    model_candidates,
+)
+from echo.media.audio import (
+    PCM_EXTENSION,
+    SAMPLE_RATE,
+    SAMPLE_WIDTH_BYTES,
+    SpeechStats,
+    decode_pcm,
+    hash_pcm,
+    iter_chunks,
+    iter_speech_chunks,
+    read_pcm,
+)
 from echo.media.video import contains_audio
-from echo.models.echo import Echo, Segment
+from echo.models.echo import QUALITY_DRAFT, QUALITY_FINAL, Echo, Segment
 from echo.monitoring.sentry import init_sentry
+from echo.utils.cache import DiskCache
+from echo.utils.cancellation import CancellationToken, JobCancelledError
 
 DEFAULT_MODEL_SIZE = "tiny"
+DRAFT_MODEL_SIZE = "tiny"
 DEFAULT_CLOUD_COMPUTE = "cpu-small"
 DRIVE_SOURCE_FILE_TIMEOUT_SECONDS = 18000
+DRIVE_SOURCE_FILE_POLL_SECONDS = 5
 DUMMY_ECHO_ID = "dummy"
+CACHE_DIRECTORY = "transcripts"
+DEFAULT_CACHE_MAX_SIZE_MB = 512
+DEFAULT_PREFETCH_DEPTH = 2
+DEFAULT_PREFETCH_MAX_SIZE_MB = 256
 
 logger = Logger(__name__)
 
@@ -26,14 +53,30 @@ logger = Logger(__name__)
 @dataclass
 class CustomBuildConfig(BuildConfig):
     model_size: str = DEFAULT_MODEL_SIZE
+    draft_model_size: Optional[str] = None
+    # Also install the smaller sizes and quantized variants so that one can be chosen by speed
+    model_candidates_enabled: bool = False
 
     def build_commands(self):
-        return [
+        candidates = model_candidates(self.model_size) if self.model_candidates_enabled else []
+        model_sizes = {self.model_size, self.draft_model_size or self.model_size}
+        model_sizes.update(model.size for model in candidates)
+        targets = [*sorted(model_sizes), "server", *(["quantize"] if len(candidates) > 0 else [])]
+
+        commands = [
             "sudo apt-get update",
             "sudo apt-get install -y ffmpeg libmagic1",
             "cd $HOME && git clone https://github.com/ggerganov/whisper.cpp.git",
-            f"cd $HOME/whisper.cpp && make {self.model_size}",
+            f"cd $HOME/whisper.cpp && make {' '.join(targets)}",
         ]
+        for model in candidates:
+            if model.quantization is not None:
+                commands.append(
+                    f"cd $HOME/whisper.cpp && ./quantize models/ggml-{model.size}.bin models/ggml-{model.name}.bin"
+                    f" {model.quantization}"
+                )
+
+        return commands
 
 
 class SpeechRecognizer(LightningWork):
@@ -43,10 +86,20 @@ class SpeechRecognizer(LightningWork):
         cloud_compute=DEFAULT_CLOUD_COMPUTE,
         drive: Drive = None,
     ):
+        two_pass_enabled = os.environ.get("ECHO_RECOGNIZER_TWO_PASS_ENABLED", "false").lower() == "true"
+        # A draft pass only makes sense if it uses a faster model than the one producing the final transcript
+        draft_model_size = DRAFT_MODEL_SIZE if two_pass_enabled and model_size != DRAFT_MODEL_SIZE else None
+        min_speed = float(os.environ.get("ECHO_RECOGNIZER_MIN_SPEED", 0))
+
         super().__init__(
             parallel=True,
             cloud_compute=CloudCompute(cloud_compute),
-            cloud_build_config=CustomBuildConfig(requirements=[], model_size=model_size),
+            cloud_build_config=CustomBuildConfig(
+                requirements=[],
+                model_size=model_size,
+                draft_model_size=draft_model_size,
+                model_candidates_enabled=min_speed > 0,
+            ),
             raise_exception=False,
         )
 
@@ -54,96 +107,546 @@ class SpeechRecognizer(LightningWork):
 
         # NOTE: Private attributes don't need to be serializable, so we use them to store complex objects
         self._drive = drive
+        self._engine: WhisperServerPool = None
+        self._draft_engine: WhisperServerPool = None
+        self._cache: DiskCache = None
+        # NOTE: Locks and executors can't be pickled, so they are created lazily inside the Work's process
+        self._lock: threading.Lock = None
+        self._accepted: threading.BoundedSemaphore = None
+        self._executor: ThreadPoolExecutor = None
+        self._prefetcher: ThreadPoolExecutor = None
+        self._prefetched_bytes = 0
 
         self.whisper_home = os.environ.get("ECHO_WHISPER_CPP_HOME", "$HOME/whisper.cpp")
+        self.threads_per_engine = int(os.environ.get("ECHO_RECOGNIZER_THREADS_PER_ENGINE", DEFAULT_THREADS_PER_SERVER))
         self.model_size = model_size
+        # Seconds of audio each engine must transcribe per second, where `0` always uses `model_size` at full precision
+        self.min_speed = min_speed
+        # Name of the model that is actually used, which is chosen by speed when `min_speed` is set
+        self.model = model_size
+        # Measured seconds each engine takes per second of audio on this host, by model name and thread count
+        self.model_real_time_factors: Dict[str, float] = {}
+        # If set, a draft transcript is produced with this model before the final one
+        self.draft_model_size = draft_model_size
+        self.cache_max_size_mb = int(os.environ.get("ECHO_RECOGNIZER_CACHE_MAX_SIZE_MB", DEFAULT_CACHE_MAX_SIZE_MB))
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.vad_enabled = os.environ.get("ECHO_RECOGNIZER_VAD_ENABLED", "true").lower() == "true"
+        # Total seconds of audio skipped by voice activity detection, i.e. never sent to the model
+        self.vad_dropped_seconds = 0.0
+        # Becomes `True` once the model is loaded into memory and ready to serve requests
+        self.ready = False
+        # Number of Echoes processed concurrently, where `0` means one per inference engine that fits into the cores
+        self.slots = int(os.environ.get("ECHO_RECOGNIZER_SLOTS_PER_WORK", 0))
+        # Unknown until the Work has started, afterwards used by the load balancer to estimate the free capacity
+        self.free_slots = None
+        # Number of Echoes accepted beyond the free slots, whose media is downloaded and decoded while waiting
+        self.prefetch_depth = int(os.environ.get("ECHO_RECOGNIZER_PREFETCH_DEPTH", DEFAULT_PREFETCH_DEPTH))
+        # Memory budget for decoded audio held ahead of transcription, beyond which audio is decoded as it is needed
+        self.prefetch_max_size_mb = int(
+            os.environ.get("ECHO_RECOGNIZER_PREFETCH_MAX_SIZE_MB", DEFAULT_PREFETCH_MAX_SIZE_MB)
+        )
+        self.last_completed_at = 0.0
+        # Seconds of audio accepted but not transcribed yet, used by the load balancer to favour less loaded Works
+        self.pending_cost = 0.0
+
+    def start_engine(self):
+        """Starts the long-lived inference engine (if needed) and blocks until the model is loaded."""
+        if self._lock is None:
+            self._lock = threading.Lock()
+
+        with self._lock:
+            if self._engine is None:
+                if self.min_speed > 0:
+                    self.model = self.select_model()
+                self._engine = WhisperServerPool(
+                    whisper_home=self.whisper_home,
+                    model_size=self.model,
+                    threads_per_server=self.threads_per_engine,
+                )
+            if self._draft_engine is None and self.draft_model_size is not None:
+                self._draft_engine = WhisperServerPool(
+                    whisper_home=self.whisper_home,
+                    model_size=self.draft_model_size,
+                    threads_per_server=self.threads_per_engine,
+                )
 
-    def recognize(self, audio_file_path: str):
-        assert os.path.exists(audio_file_path), f"File does not exist: {audio_file_path}"
+            for engine in [self._engine, self._draft_engine]:
+                if engine is not None and not engine.is_ready():
+                    self.ready = False
+                    engine.start()
+                    engine.wait_until_ready()
 
-        output_txt = f"{audio_file_path}.txt"
-        output_srt = f"{audio_file_path}.srt"
+            if not self.ready:
+                self.ready = True
 
-        commands = [
-            f"{self.whisper_home}/main",
-            f"-m {self.whisper_home}/models/ggml-{self.model_size}.bin",
-            audio_file_path,
-            "-pc",
-            "--output-txt",
-            "--output-srt",
-        ]
+    def select_model(self) -> str:
+        """Returns the most accurate installed model (up to `model_size`) which meets the speed budget."""
+        registry = ModelRegistry(
+            self.whisper_home, candidates=model_candidates(self.model_size), threads=self.threads_per_engine
+        )
+        model = registry.select(self.min_speed)
+        self.model_real_time_factors = dict(registry.real_time_factors)
+
+        logger.info(f"Selected model `{model.name}` to transcribe at least {self.min_speed}s of audio per second")
+        return model.name
+
+    def start_slots(self):
+        """Starts the executor which runs several recognition jobs side by side.
+
+        Each slot is guaranteed at least one inference engine (`threads_per_engine` threads), and engines that are not
+        needed by other slots are used to transcribe more chunks of the same job in parallel.
+        """
+        self.start_engine()
+
+        if self._executor is None:
+            self.slots = self.slots or self._engine.size
+            self._accepted = threading.BoundedSemaphore(self.slots + self.prefetch_depth)
+            self._executor = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="recognizer-slot")
+            self._prefetcher = ThreadPoolExecutor(
+                max_workers=self.slots + self.prefetch_depth, thread_name_prefix="recognizer-prefetch"
+            )
+            self.free_slots = self.slots
 
-        # TODO: Use Python bindings to `whisper.cpp` when they are officially released
-        subprocess.call(" ".join(commands), shell=True)
+    def get_cached_result(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Returns a previous recognition result for the same audio and model, if there is one."""
+        if self.cache_max_size_mb <= 0:
+            return None
+
+        with self._lock:
+            if self._cache is None:
+                self._cache = DiskCache(
+                    CACHE_DIRECTORY, max_size_bytes=self.cache_max_size_mb * 1024 * 1024, drive=self._drive
+                )
+
+        cached = self._cache.get(cache_key)
+        with self._lock:
+            self.cache_hits, self.cache_misses = self._cache.hits, self._cache.misses
 
-        result = {"text": "", "segments": []}
-        with open(output_txt) as f:
-            result["text"] = f.read()
+        return json.loads(cached) if cached is not None else None
 
-        subs = pysrt.open(output_srt)
-        for index, sub in enumerate(subs):
+    def recognize(
+        self,
+        pcm: Iterable[bytes],
+        speech_stats: Optional[SpeechStats] = None,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Transcribes a stream of 16 kHz mono PCM, yielding the segments of each chunk in order as soon as they are
+        ready.
+
+        If voice activity detection is enabled, only the regions with speech are sent to the model and `speech_stats`
+        is updated with the amount of audio that was skipped.
+        """
+        self.start_engine()
+
+        chunks = self.split_audio(pcm, speech_stats=speech_stats)
+        return self.transcribe_chunks(chunks, self._engine, cancellation=cancellation)
+
+    def split_audio(
+        self, pcm: Iterable[bytes], speech_stats: Optional[SpeechStats] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Splits long audio at silences so that the chunks can be transcribed in parallel across an engine pool."""
+        return iter_speech_chunks(pcm, stats=speech_stats) if self.vad_enabled else iter_chunks(pcm)
+
+    def transcribe_chunks(
+        self,
+        chunks: Iterable[Tuple[int, bytes]],
+        engine: WhisperServerPool,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Transcribes chunks of audio on the given engine pool, yielding the segments of each chunk in order.
+
+        If the job is cancelled, chunks which are waiting for an engine are dropped and the ones being transcribed are
+        aborted.
+        """
+        # Bound the number of chunks held in memory while waiting for an idle engine
+        max_chunks_in_flight = 2 * engine.size
+        in_flight = deque()
+        segment_id = 0
+        job_id = cancellation.job_id if cancellation is not None else None
+
+        # TODO: Use Python bindings to `whisper.cpp` when they are officially released
+        with ThreadPoolExecutor(max_workers=engine.size) as executor:
+            try:
+                for offset, chunk in chunks:
+                    if cancellation is not None:
+                        cancellation.raise_if_cancelled()
+
+                    future = executor.submit(engine.transcribe, chunk, job_id)
+                    in_flight.append((offset, len(chunk) // SAMPLE_WIDTH_BYTES, future))
+
+                    if len(in_flight) >= max_chunks_in_flight:
+                        result = self._stitch(
+                            *in_flight.popleft(), first_segment_id=segment_id, cancellation=cancellation
+                        )
+                        segment_id += len(result["segments"])
+                        yield result
+
+                while in_flight:
+                    result = self._stitch(*in_flight.popleft(), first_segment_id=segment_id, cancellation=cancellation)
+                    segment_id += len(result["segments"])
+                    yield result
+            except (JobCancelledError, GeneratorExit):
+                # Don't wait for chunks whose results are not needed anymore
+                for _, _, future in in_flight:
+                    future.cancel()
+                if cancellation is not None and cancellation.cancelled():
+                    engine.cancel(job_id)
+                raise
+
+    def _stitch(
+        self, offset: int, length: int, future: Future, first_segment_id: int, cancellation: Optional[CancellationToken]
+    ) -> Dict[str, Any]:
+        """Waits for a chunk to be transcribed and shifts its segments by the position of the chunk."""
+        offset_seconds = offset / SAMPLE_RATE
+        result = {"until": (offset + length) / SAMPLE_RATE, "segments": []}
+        response = cancellation.wait(future) if cancellation is not None else future.result()
+        for segment in response["segments"]:
+            start = round(offset_seconds + segment["start"], 3)
             result["segments"].append(
                 {
-                    "id": index,
-                    "text": sub.text,
-                    "seek": sub.start.ordinal,
-                    "start": int(sub.start.ordinal / 1000),
-                    "end": int(sub.end.ordinal / 1000),
+                    "id": first_segment_id + len(result["segments"]),
+                    "text": segment["text"].strip(),
+                    "seek": round(start * 1000),
+                    "start": start,
+                    "end": round(offset_seconds + segment["end"], 3),
                 }
             )
 
         return result
 
-    def convert_to_audio(self, source_file_path: str):
+    def convert_to_audio(self, source_file_path: str) -> Iterator[bytes]:
+        """Streams the audio of the source file as 16 kHz mono PCM without writing an intermediate file."""
+        if source_file_path.endswith(PCM_EXTENSION):
+            return read_pcm(source_file_path)
+
         if not contains_audio(source_file_path):
             raise ValueError(f"Source does not contain an audio stream: {source_file_path}")
 
-        wav_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        # TODO: Handle exceptions from `ffmpeg`
-        subprocess.call(f"ffmpeg -i {source_file_path} -y -ar 16000 -ac 1 -c:a pcm_s16le {wav_file.name}", shell=True)
-
-        return wav_file.name
+        return decode_pcm(source_file_path)
+
+    def download_metadata(self, echo: Echo) -> Optional[Dict[str, Any]]:
+        """Downloads the metadata which the fileserver saves once an uploaded file is stored, if it is there yet."""
+        meta_file_path = f"{echo.source_file_path}.meta"
+        try:
+            self._drive.get(meta_file_path, overwrite=True)
+            with open(meta_file_path) as f:
+                return json.load(f)
+        except Exception:
+            return None
+        finally:
+            if os.path.exists(meta_file_path):
+                os.remove(meta_file_path)
+
+    def download_source(self, echo: Echo, cancellation: CancellationToken) -> str:
+        """Waits for the source media of an Echo to be available on the Drive and downloads it.
+
+        Returns the path of the downloaded file to decode the audio from, which is the audio the fileserver already
+        decoded on upload if there is any. All sources (including YouTube videos) are uploaded through the fileserver,
+        so they only count as available once their metadata is saved, after the source and the decoded audio. Stops
+        waiting if the Echo is deleted in the meantime.
+        """
+        deadline = time.time() + DRIVE_SOURCE_FILE_TIMEOUT_SECONDS
+        while True:
+            cancellation.raise_if_cancelled()
+            meta = self.download_metadata(echo)
+            if meta is not None and meta.get("has_audio") is False:
+                raise ValueError(f"Source does not contain an audio stream: {echo.source_file_path}")
+            if meta is not None and meta.get("audio") is not None:
+                audio_file_path = f"{echo.source_file_path}{PCM_EXTENSION}"
+                self._drive.get(audio_file_path, overwrite=True)
+                return audio_file_path
+
+            if meta is None:
+                if time.time() > deadline:
+                    raise TimeoutError(f"Upload of {echo.source_file_path} did not finish in time")
+                time.sleep(DRIVE_SOURCE_FILE_POLL_SECONDS)
+                continue
+
+            try:
+                self._drive.get(echo.source_file_path, timeout=DRIVE_SOURCE_FILE_POLL_SECONDS)
+                return echo.source_file_path
+            except Exception:
+                if time.time() > deadline:
+                    raise
+
+    def remove_download(self, file_path: str):
+        """Removes the local copy of a file downloaded by `download_source` once its job has ended.
+
+        Only the file which was actually downloaded is removed, since Works running locally share their working
+        directory (e.g. with the fileserver, which keeps its own copies of the sources).
+        """
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def prefetch(self, echo: Echo, cancellation: CancellationToken) -> Tuple[str, Optional[List[bytes]]]:
+        """Downloads the source media of an Echo and decodes it to PCM ahead of its turn.
+
+        Returns the downloaded file along with the PCM, which is `None` if the decoded audio does not fit into the
+        prefetch budget, in which case it is decoded while being transcribed instead.
+        """
+        audio_file_path = self.download_source(echo, cancellation)
+        try:
+            return audio_file_path, self._prefetch_audio(echo, audio_file_path, cancellation)
+        except Exception:
+            # The job never gets to see the file, so it cannot remove it either
+            self.remove_download(audio_file_path)
+            raise
+
+    def _prefetch_audio(
+        self, echo: Echo, audio_file_path: str, cancellation: CancellationToken
+    ) -> Optional[List[bytes]]:
+        pcm: List[bytes] = []
+        buffers = self.convert_to_audio(audio_file_path)
+        try:
+            for buffer in buffers:
+                cancellation.raise_if_cancelled()
+                if not self._reserve_prefetched(len(buffer)):
+                    logger.info(f"Prefetch budget exhausted, decoding audio during transcription for: {echo.id}")
+                    break
+                pcm.append(buffer)
+            else:
+                return pcm
+        except JobCancelledError:
+            self._release_prefetched(pcm)
+            raise
+        finally:
+            # Closing the stream stops `ffmpeg` right away if it has not finished yet
+            buffers.close()
+
+        self._release_prefetched(pcm)
+        return None
+
+    def _reserve_prefetched(self, size: int) -> bool:
+        """Counts decoded audio against the prefetch budget, returning `False` if it does not fit anymore."""
+        with self._lock:
+            if self._prefetched_bytes + size > self.prefetch_max_size_mb * 1024 * 1024:
+                return False
+            self._prefetched_bytes += size
+            return True
+
+    def _release_prefetched(self, pcm: List[bytes]):
+        with self._lock:
+            self._prefetched_bytes -= sum(len(buffer) for buffer in pcm)
 
     def run(self, echo: Echo, db_url: str):
-        """Runs speech recognition and returns the text for a given Echo."""
-        # NOTE: Dummy Echo is used to spin up the cloud machine on app startup so subsequent requests are faster
+        """Schedules speech recognition for a given Echo, blocking only while all slots and the prefetch queue are
+        busy.
+
+        Routing on `free_slots` is best effort, since the load balancer only sees changes once the state of the Work
+        has reached the Flow. Blocking here is what holds back calls which were dispatched on a stale value.
+        """
+        # NOTE: Dummy Echo is used to spin up the cloud machine and load the model on app startup so subsequent
+        # requests are faster
         if echo.id == DUMMY_ECHO_ID:
-            logger.info("Skipping dummy Echo")
+            logger.info("Warming up model for dummy Echo")
+            self.start_slots()
             return
 
+        self.start_slots()
+
+        # The Echo can be deleted at any time, after which its job is dropped (or aborted if it already started)
+        echo_db_client = DatabaseClient(model=Echo, db_url=db_url)
+        cancellation = CancellationToken(echo.id, is_cancelled=lambda: echo_db_client.get_echo(echo.id) is None)
+
+        self._accepted.acquire()
+        self._update_free_slots(-1, cost=echo.duration_seconds or 0.0)
+        # Downloading and decoding happen in the background, so the media of queued Echoes is ready by their turn
+        prefetched = self._prefetcher.submit(self.prefetch, echo, cancellation)
+        self._executor.submit(self._run_in_slot, echo, db_url, prefetched, cancellation)
+
+    def _update_free_slots(self, change: int, cost: float):
+        """Reports the change in free slots (and pending cost) to the load balancer, which sees it with a delay."""
+        with self._lock:
+            self.free_slots += change
+            self.pending_cost = max(0.0, self.pending_cost - change * cost)
+            if change > 0:
+                self.last_completed_at = time.time()
+
+    def _run_in_slot(self, echo: Echo, db_url: str, prefetched: Future, cancellation: CancellationToken):
+        audio_file_path, pcm = None, None
+        try:
+            audio_file_path, pcm = prefetched.result()
+            cancellation.raise_if_cancelled(force=True)
+            self.transcribe_echo(echo, db_url, pcm=pcm, cancellation=cancellation, audio_file_path=audio_file_path)
+        except JobCancelledError:
+            logger.info(f"Cancelled speech recognition for deleted Echo: {echo.id}")
+        except Exception as e:
+            logger.error(f"Failed to recognize speech from {echo.id}: {e}", exc_info=True)
+        finally:
+            if pcm is not None:
+                self._release_prefetched(pcm)
+            if audio_file_path is not None:
+                self.remove_download(audio_file_path)
+            self._accepted.release()
+            self._update_free_slots(1, cost=echo.duration_seconds or 0.0)
+
+    def transcribe_echo(
+        self,
+        echo: Echo,
+        db_url: str,
+        pcm: Optional[List[bytes]] = None,
+        cancellation: Optional[CancellationToken] = None,
+        audio_file_path: Optional[str] = None,
+    ):
+        """Runs speech recognition and saves the text and segments for a given Echo.
+
+        The source media (or the audio decoded from it, as `audio_file_path`) must already be downloaded from the
+        Drive. If its audio was already decoded, it can be passed as `pcm` to skip decoding it again. Raises
+        `JobCancelledError` if the Echo is deleted in the meantime.
+        """
         logger.info("Initializing database client")
         echo_db_client = DatabaseClient(model=Echo, db_url=db_url)
         segment_db_client = DatabaseClient(model=Segment, db_url=db_url)
+        if cancellation is None:
+            cancellation = CancellationToken(echo.id, is_cancelled=lambda: echo_db_client.get_echo(echo.id) is None)
 
         logger.info(f"Recognizing speech from: {echo.id}")
 
-        audio_file_path = echo.source_file_path
-        self._drive.get(echo.source_file_path, timeout=DRIVE_SOURCE_FILE_TIMEOUT_SECONDS)
+        decoded_file_path = None
+        source_file_path = audio_file_path or echo.source_file_path
+        try:
+            if pcm is None and not source_file_path.endswith(PCM_EXTENSION):
+                # The audio is read twice (for the cache key and to transcribe it), so only decode the media once
+                decoded_file_path = f"{source_file_path}{PCM_EXTENSION}"
+                with open(decoded_file_path, "wb") as f:
+                    for buffer in self.convert_to_audio(source_file_path):
+                        f.write(buffer)
+                source_file_path = decoded_file_path
+
+            self._transcribe_audio(echo, echo_db_client, segment_db_client, pcm, source_file_path, cancellation)
+        finally:
+            if decoded_file_path is not None and os.path.exists(decoded_file_path):
+                os.remove(decoded_file_path)
 
-        audio_file_path = self.convert_to_audio(echo.source_file_path)
+        logger.info(f"Finished recognizing speech from: {echo.id}")
 
-        # Run the speech recognition model and save the result
-        result = self.recognize(audio_file_path)
+    def _transcribe_audio(
+        self,
+        echo: Echo,
+        echo_db_client: DatabaseClient,
+        segment_db_client: DatabaseClient,
+        pcm: Optional[List[bytes]],
+        audio_file_path: str,
+        cancellation: CancellationToken,
+    ):
+        def audio() -> Iterable[bytes]:
+            return pcm if pcm is not None else read_pcm(audio_file_path)
+
+        # Identical audio (re-uploads, the same YouTube video, etc) is only transcribed once per model
+        cache_key = f"{hash_pcm(audio())}-{self.model}.json"
+        cached_result = self.get_cached_result(cache_key)
+        speech_stats = SpeechStats()
+        echo.model = self.model
+        if cached_result is not None:
+            logger.info(f"Found cached result for: {echo.id}")
+            all_segments = self.save_results(echo, [cached_result], echo_db_client, segment_db_client, cancellation)
+        elif self.draft_model_size is not None:
+            all_segments = self.transcribe_in_two_passes(
+                echo, audio(), echo_db_client, segment_db_client, speech_stats, cancellation
+            )
+        else:
+            # Run the speech recognition model and save the segments as soon as each chunk is transcribed
+            results = self.recognize(audio(), speech_stats=speech_stats, cancellation=cancellation)
+            all_segments = self.save_results(echo, results, echo_db_client, segment_db_client, cancellation)
+
+        if self.vad_enabled and cached_result is None:
+            logger.info(
+                f"Skipped {speech_stats.dropped_seconds:.1f}s of {speech_stats.total_seconds:.1f}s audio without speech"
+                f" for: {echo.id}"
+            )
+            with self._lock:
+                self.vad_dropped_seconds += speech_stats.dropped_seconds
+            # Trailing audio without speech never produces a chunk, so mark the whole audio as transcribed
+            echo.transcribed_until = speech_stats.total_seconds
 
         echo.completed_transcription_at = datetime.now()
-        echo.text = result["text"]
-        echo_db_client.put(echo)
-
-        segments: List[Segment] = []
-        for segment in result["segments"]:
-            segments.append(
-                Segment(
-                    id=f"{echo.id}-{segment['id']}",
-                    echo_id=echo.id,
-                    text=segment["text"],
-                    seek=segment["seek"],
-                    start=segment["start"],
-                    end=segment["end"],
+        echo.text = "\n".join(segment["text"] for segment in all_segments)
+        echo.quality = QUALITY_FINAL
+        echo.model = self.model
+        self.update_echo(echo, echo_db_client, cancellation)
+
+        if cached_result is None and self._cache is not None:
+            self._cache.put(cache_key, json.dumps({"until": echo.transcribed_until, "segments": all_segments}).encode())
+
+    def transcribe_in_two_passes(
+        self,
+        echo: Echo,
+        pcm: Iterable[bytes],
+        echo_db_client: DatabaseClient,
+        segment_db_client: DatabaseClient,
+        speech_stats: SpeechStats,
+        cancellation: CancellationToken,
+    ) -> List[Dict[str, Any]]:
+        """Saves a draft transcript from the fast draft model, then replaces it with the one from the configured model.
+
+        Returns the final segments. The refinement is skipped if the Echo is deleted after the draft was saved.
+        """
+        self.start_engine()
+
+        # Both passes share the decoded audio, which is bounded by the maximum duration of the source media
+        chunks = list(self.split_audio(pcm, speech_stats=speech_stats))
+
+        echo.quality = QUALITY_DRAFT
+        echo.model = self.draft_model_size
+        draft_results = self.transcribe_chunks(chunks, self._draft_engine, cancellation=cancellation)
+        draft_segments = self.save_results(echo, draft_results, echo_db_client, segment_db_client, cancellation)
+        echo.text = "\n".join(segment["text"] for segment in draft_segments)
+        self.update_echo(echo, echo_db_client, cancellation)
+
+        cancellation.raise_if_cancelled(force=True)
+        results = list(self.transcribe_chunks(chunks, self._engine, cancellation=cancellation))
+
+        # Keep showing the draft until the whole refined transcript is ready, then swap the segments at once
+        segment_db_client.delete_segments_for_echo(echo.id)
+        return self.save_results(echo, results, echo_db_client, segment_db_client, cancellation)
+
+    def save_results(
+        self,
+        echo: Echo,
+        results: Iterable[Dict[str, Any]],
+        echo_db_client: DatabaseClient,
+        segment_db_client: DatabaseClient,
+        cancellation: CancellationToken,
+    ) -> List[Dict[str, Any]]:
+        """Saves the segments of each result as soon as it is available and returns all of them."""
+        all_segments: List[Dict[str, Any]] = []
+        for result in results:
+            segments: List[Segment] = []
+            for segment in result["segments"]:
+                segments.append(
+                    Segment(
+                        id=f"{echo.id}-{segment['id']}",
+                        echo_id=echo.id,
+                        text=segment["text"],
+                        seek=segment["seek"],
+                        start=segment["start"],
+                        end=segment["end"],
+                    )
                 )
-            )
+            all_segments.extend(result["segments"])
 
-        segment_db_client.create_segments_for_echo(segments)
+            if len(segments) > 0 and not segment_db_client.create_segments_for_echo(segments):
+                self._cancel_deleted(cancellation)
 
-        logger.info(f"Finished recognizing speech from: {echo.id}")
+            echo.transcribed_until = result["until"]
+            self.update_echo(echo, echo_db_client, cancellation)
+
+        return all_segments
+
+    def update_echo(self, echo: Echo, echo_db_client: DatabaseClient, cancellation: CancellationToken):
+        if not echo_db_client.put(echo):
+            self._cancel_deleted(cancellation)
+
+    def _cancel_deleted(self, cancellation: CancellationToken):
+        # The Echo was deleted, so there is no point in continuing
+        cancellation.cancel()
+        cancellation.raise_if_cancelled()
 
-        os.remove(audio_file_path)
+    def on_exit(self):
+        for executor in [self._prefetcher, self._executor]:
+            if executor is not None:
+                executor.shutdown(wait=False)
+        for engine in [self._engine, self._draft_engine]:
+            if engine is not None:
+                engine.stop()
@@ -0,0 +1,314 @@
+import io
+import json
+import os
+import queue
+import socket
+import subprocess
+import time
+import wave
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import requests
+from lightning.app.utilities.app_helpers import Logger
+
+from echo.media.audio import SAMPLE_RATE, SAMPLE_WIDTH_BYTES
+
+logger = Logger(__name__)
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_THREADS_PER_SERVER = 4
+DEFAULT_STARTUP_TIMEOUT_SECONDS = 600
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60 * 60
+HEALTH_CHECK_INTERVAL_SECONDS = 0.5
+# From the least to the most accurate
+MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+QUANTIZATIONS = ["q5_0", "q8_0"]
+# Ships with `whisper.cpp` and is used to measure how fast each model runs on the current host
+CALIBRATION_SAMPLE = os.path.join("samples", "jfk.wav")
+MEASUREMENTS_FILENAME = "real_time_factors.json"
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """Wraps raw 16-bit mono PCM samples in a WAV container without touching the disk."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH_BYTES)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+
+    return buffer.getvalue()
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class WhisperServer:
+    """Keeps a `whisper.cpp` server process running so the model is loaded once and stays warm between jobs."""
+
+    def __init__(self, whisper_home: str, model_size: str, threads: Optional[int] = None, host: str = DEFAULT_HOST):
+        self.whisper_home = os.path.expandvars(os.path.expanduser(whisper_home))
+        self.model_size = model_size
+        self.threads = threads or os.cpu_count() or 1
+        self.host = host
+        self.port: Optional[int] = None
+
+        self._process: Optional[subprocess.Popen] = None
+        self._session = requests.Session()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def model_path(self) -> str:
+        return os.path.join(self.whisper_home, "models", f"ggml-{self.model_size}.bin")
+
+    def is_running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def is_ready(self) -> bool:
+        """Returns whether the server process is up and has finished loading the model."""
+        if not self.is_running():
+            return False
+
+        try:
+            resp = self._session.get(f"{self.url}/health", timeout=1)
+        except requests.exceptions.RequestException:
+            return False
+
+        # NOTE: Older builds have no `/health` route, but they only start listening once the model is loaded
+        return resp.status_code in (200, 404)
+
+    def start(self):
+        if self.is_running():
+            return
+
+        assert os.path.exists(self.model_path), f"Model does not exist: {self.model_path}"
+
+        self.port = _free_port(self.host)
+        commands = [
+            os.path.join(self.whisper_home, "server"),
+            "-m",
+            self.model_path,
+            "-t",
+            str(self.threads),
+            "--host",
+            self.host,
+            "--port",
+            str(self.port),
+        ]
+
+        logger.info(f"Starting whisper.cpp server for model `{self.model_size}` on port {self.port}")
+        self._process = subprocess.Popen(commands, stdout=subprocess.DEVNULL)
+
+    def wait_until_ready(self, timeout: float = DEFAULT_STARTUP_TIMEOUT_SECONDS):
+        """Blocks until the model is loaded, raising if the server exits or does not become ready in time."""
+        deadline = time.time() + timeout
+        while not self.is_ready():
+            if not self.is_running():
+                raise RuntimeError(f"whisper.cpp server exited with code {self._process.returncode}")
+            if time.time() > deadline:
+                raise TimeoutError(f"whisper.cpp server did not become ready within {timeout} seconds")
+            time.sleep(HEALTH_CHECK_INTERVAL_SECONDS)
+
+    def stop(self):
+        if self.is_running():
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+        self._process = None
+
+    def transcribe(self, pcm: bytes) -> Dict[str, Any]:
+        """Runs inference on 16 kHz mono PCM samples using the already loaded model.
+
+        Returns the structured output of the server, including the segments with their start and end in seconds.
+        """
+        if not self.is_running():
+            logger.warn("whisper.cpp server is not running, restarting it")
+            self.start()
+            self.wait_until_ready()
+
+        resp = self._session.post(
+            f"{self.url}/inference",
+            files={"file": ("audio.wav", pcm_to_wav(pcm), "audio/wav")},
+            data={"response_format": "verbose_json", "temperature": "0.0"},
+            timeout=DEFAULT_REQUEST_TIMEOUT_SECONDS,
+        )
+        resp.raise_for_status()
+
+        return resp.json()
+
+
+class WhisperServerPool:
+    """Runs several `whisper.cpp` servers side by side so that chunks of audio can be transcribed in parallel.
+
+    The pool is sized so that all servers together use every core of the machine.
+    """
+
+    def __init__(
+        self,
+        whisper_home: str,
+        model_size: str,
+        threads_per_server: int = DEFAULT_THREADS_PER_SERVER,
+        size: Optional[int] = None,
+    ):
+        cpu_count = os.cpu_count() or 1
+        threads_per_server = min(threads_per_server, cpu_count)
+
+        self.size = size or max(1, cpu_count // threads_per_server)
+        self.servers: List[WhisperServer] = [
+            WhisperServer(whisper_home=whisper_home, model_size=model_size, threads=threads_per_server)
+            for _ in range(self.size)
+        ]
+
+        self._idle: "queue.Queue[WhisperServer]" = queue.Queue()
+        for server in self.servers:
+            self._idle.put(server)
+        # Which job each busy server is working for
+        self._jobs: Dict[WhisperServer, Optional[str]] = {}
+
+    def is_ready(self) -> bool:
+        return all(server.is_ready() for server in self.servers)
+
+    def start(self):
+        for server in self.servers:
+            server.start()
+
+    def wait_until_ready(self, timeout: float = DEFAULT_STARTUP_TIMEOUT_SECONDS):
+        for server in self.servers:
+            server.wait_until_ready(timeout=timeout)
+
+    def stop(self):
+        for server in self.servers:
+            server.stop()
+
+    def transcribe(self, pcm: bytes, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Runs inference on the next idle server, blocking until one becomes available."""
+        server = self._idle.get()
+        self._jobs[server] = job_id
+        try:
+            return server.transcribe(pcm)
+        finally:
+            self._jobs.pop(server, None)
+            self._idle.put(server)
+
+    def cancel(self, job_id: str):
+        """Aborts the inference running for the given job by stopping its servers, which restart on their next use."""
+        for server, busy_with in list(self._jobs.items()):
+            if busy_with == job_id:
+                logger.info(f"Stopping whisper.cpp server on port {server.port} to cancel job {job_id}")
+                server.stop()
+
+
+@dataclass(frozen=True)
+class WhisperModel:
+    """A `whisper.cpp` model, optionally quantized to fewer bits per weight which makes it smaller and faster."""
+
+    size: str
+    quantization: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.size if self.quantization is None else f"{self.size}-{self.quantization}"
+
+
+def model_candidates(max_model_size: str) -> List[WhisperModel]:
+    """Returns every size up to the given one along with its quantized variants, from the least to the most
+    accurate."""
+    if max_model_size not in MODEL_SIZES:
+        # NOTE: Variants like `base.en` or `large-v2` are used as they are, only trading off the quantization
+        sizes = [max_model_size]
+    else:
+        sizes = MODEL_SIZES[: MODEL_SIZES.index(max_model_size) + 1]
+
+    return [WhisperModel(size, quantization) for size in sizes for quantization in [*QUANTIZATIONS, None]]
+
+
+class ModelRegistry:
+    """Knows which `whisper.cpp` models are installed and how fast each of them runs on the current host.
+
+    Measurements are stored next to the models, so each model is only measured once per host and thread count.
+    """
+
+    def __init__(self, whisper_home: str, candidates: List[WhisperModel], threads: int = DEFAULT_THREADS_PER_SERVER):
+        self.whisper_home = os.path.expandvars(os.path.expanduser(whisper_home))
+        self.candidates = candidates
+        self.threads = threads
+        self.real_time_factors: Dict[str, float] = {}
+
+        try:
+            with open(self.measurements_path) as f:
+                self.real_time_factors = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    @property
+    def measurements_path(self) -> str:
+        return os.path.join(self.whisper_home, "models", MEASUREMENTS_FILENAME)
+
+    def _measurement_key(self, model: WhisperModel) -> str:
+        return f"{model.name}@{self.threads}"
+
+    def is_installed(self, model: WhisperModel) -> bool:
+        return os.path.exists(WhisperServer(self.whisper_home, model.name).model_path)
+
+    def real_time_factor(self, model: WhisperModel) -> float:
+        """Returns the seconds it takes one engine to transcribe a second of audio, measuring it if needed."""
+        key = self._measurement_key(model)
+        if key not in self.real_time_factors:
+            self.real_time_factors[key] = self.measure(model)
+
+            with open(f"{self.measurements_path}.tmp", "w") as f:
+                json.dump(self.real_time_factors, f, indent=2)
+            os.replace(f"{self.measurements_path}.tmp", self.measurements_path)
+
+        return self.real_time_factors[key]
+
+    def measure(self, model: WhisperModel) -> float:
+        with wave.open(os.path.join(self.whisper_home, CALIBRATION_SAMPLE), "rb") as wav:
+            pcm = wav.readframes(wav.getnframes())
+        audio_seconds = len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH_BYTES)
+
+        logger.info(f"Measuring the speed of model `{model.name}` with {self.threads} threads")
+        server = WhisperServer(self.whisper_home, model.name, threads=self.threads)
+        server.start()
+        try:
+            server.wait_until_ready()
+            # The first run includes one-off allocations, so keep the fastest of two runs
+            durations = []
+            for _ in range(2):
+                start = time.perf_counter()
+                server.transcribe(pcm)
+                durations.append(time.perf_counter() - start)
+        finally:
+            server.stop()
+
+        return min(durations) / audio_seconds
+
+    def select(self, min_speed: float) -> WhisperModel:
+        """Returns the most accurate installed model which transcribes at least `min_speed` seconds of audio per
+        second, or the fastest one if none of them is fast enough."""
+        installed = [model for model in self.candidates if self.is_installed(model)]
+        if len(installed) == 0:
+            raise FileNotFoundError(f"None of the models are installed in {self.whisper_home}")
+
+        selected = installed[0]
+        for size in dict.fromkeys(model.size for model in installed):
+            fast_enough = [
+                model for model in installed if model.size == size and 1 / self.real_time_factor(model) >= min_speed
+            ]
+            # Larger models are slower, so there is no need to measure them once a whole size is too slow
+            if len(fast_enough) == 0:
+                break
+            selected = fast_enough[-1]
+
+        return selected
@@ -1,12 +1,16 @@
 import pathlib
 import tempfile
+from typing import Optional
 
 import requests
 from lightning import BuildConfig, CloudCompute, LightningWork
 from lightning.app.utilities.app_helpers import Logger
 from pytube import YouTube
 
+from echo.components.database.client import DatabaseClient
+from echo.models.echo import Echo
 from echo.monitoring.sentry import init_sentry
+from echo.utils.cancellation import CancellationToken, JobCancelledError
 
 logger = Logger(__name__)
 
@@ -31,8 +35,11 @@ class YouTuber(LightningWork):
 
         self.base_dir = base_dir
 
-    def run(self, youtube_url: str, echo_id: str, fileserver_url: str):
-        """Download a YouTube video and save it to the shared Drive."""
+    def run(self, youtube_url: str, echo_id: str, fileserver_url: str, db_url: Optional[str] = None):
+        """Download a YouTube video and save it to the shared Drive.
+
+        If `db_url` is given, the download is cancelled as soon as the Echo is deleted.
+        """
         # NOTE: Dummy Echo is used to spin up the cloud machine on app startup so subsequent requests are faster
         if youtube_url == DUMMY_YOUTUBE_URL and echo_id == DUMMY_ECHO_ID:
             logger.info("Skipping dummy Echo")
@@ -47,14 +54,37 @@ class YouTuber(LightningWork):
         if not fileserver_url:
             raise ValueError("No Fileserver URL provided.")
 
+        cancellation = None
+        if db_url is not None:
+            echo_db_client = DatabaseClient(model=Echo, db_url=db_url)
+            cancellation = CancellationToken(echo_id, is_cancelled=lambda: echo_db_client.get_echo(echo_id) is None)
+
+        try:
+            self.download(youtube_url, echo_id, fileserver_url, cancellation)
+        except JobCancelledError:
+            logger.info(f"Cancelled download for deleted Echo: {echo_id}")
+
+    def download(
+        self, youtube_url: str, echo_id: str, fileserver_url: str, cancellation: Optional[CancellationToken] = None
+    ):
+        def on_progress(*_):
+            if cancellation is not None:
+                cancellation.raise_if_cancelled()
+
+        if cancellation is not None:
+            cancellation.raise_if_cancelled(force=True)
+
         # Create a temporary file to store the downlaoded video
         download_file = tempfile.NamedTemporaryFile(suffix=".mp4")
         download_path = pathlib.Path(download_file.name)
 
-        # Download video
-        YouTube(youtube_url).streams.filter(progressive=True, file_extension="mp4").order_by(
-            "resolution"
-        ).asc().first().download(output_path=download_path.parent.absolute(), filename=download_path.name)
+        # Download video, checking between chunks whether the Echo still exists
+        youtube = YouTube(youtube_url, on_progress_callback=on_progress)
+        stream = youtube.streams.filter(progressive=True, file_extension="mp4").order_by("resolution").asc().first()
+        stream.download(output_path=download_path.parent.absolute(), filename=download_path.name)
+
+        if cancellation is not None:
+            cancellation.raise_if_cancelled(force=True)
 
         # Upload video to fileserver where it will be added to the shared Drive
         requests.put(f"{fileserver_url}/upload/{echo_id}", files={"file": open(download_file.name, "rb")})
@@ -0,0 +1,262 @@
+import hashlib
+import itertools
+import subprocess
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH_BYTES = 2
+FRAME_SECONDS = 0.02
+DEFAULT_MIN_CHUNK_SECONDS = 10
+DEFAULT_MAX_CHUNK_SECONDS = 30
+# Read one second of audio at a time from `ffmpeg`
+DEFAULT_READ_SIZE = SAMPLE_RATE * SAMPLE_WIDTH_BYTES
+# Raw 16 kHz mono 16-bit PCM, as returned by `decode_pcm`
+PCM_EXTENSION = ".pcm"
+PCM_FORMAT = "s16le"
+# Frames quieter than roughly -70 dBFS are never considered speech, which only rules out (near) digital silence
+DEFAULT_MIN_SPEECH_RMS = 10
+DEFAULT_SPEECH_TO_NOISE_RATIO = 3
+# The noise floor starts out at the level of the quietest frames at the beginning of the recording
+DEFAULT_NOISE_CALIBRATION_SECONDS = 10
+NOISE_CALIBRATION_PERCENTILE = 5
+DEFAULT_MIN_SILENCE_SECONDS = 2
+DEFAULT_SPEECH_PADDING_SECONDS = 0.3
+
+
+def decode_pcm(source_file_path: str, read_size: int = DEFAULT_READ_SIZE) -> Iterator[bytes]:
+    """Decodes a media file to 16 kHz mono 16-bit PCM, streaming the samples from `ffmpeg` through a pipe."""
+    commands = [
+        "ffmpeg",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-i",
+        source_file_path,
+        "-f",
+        PCM_FORMAT,
+        "-ac",
+        "1",
+        "-ar",
+        str(SAMPLE_RATE),
+        "pipe:1",
+    ]
+    process = subprocess.Popen(commands, stdout=subprocess.PIPE)
+
+    try:
+        buffer = process.stdout.read(read_size)
+        while buffer:
+            yield buffer
+            buffer = process.stdout.read(read_size)
+    finally:
+        # Stop `ffmpeg` early if the consumer stops reading before the end of the stream
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {source_file_path} (exit code {process.returncode})")
+
+
+def read_pcm(file_path: str, read_size: int = DEFAULT_READ_SIZE) -> Iterator[bytes]:
+    """Streams PCM samples which were already decoded to a file, in the same buffers as `decode_pcm`."""
+    with open(file_path, "rb") as f:
+        buffer = f.read(read_size)
+        while buffer:
+            yield buffer
+            buffer = f.read(read_size)
+
+
+def hash_pcm(buffers: Iterable[bytes]) -> str:
+    """Returns a content hash of a stream of PCM samples, which identifies the audio independent of its container."""
+    digest = hashlib.sha256()
+    for buffer in buffers:
+        digest.update(buffer)
+
+    return digest.hexdigest()
+
+
+def frame_energies(samples: np.ndarray, frame_size: int) -> np.ndarray:
+    """Returns the RMS energy of each consecutive frame of samples (a trailing partial frame is dropped)."""
+    frame_count = len(samples) // frame_size
+    frames = samples[: frame_count * frame_size].astype(np.float32).reshape(frame_count, frame_size)
+
+    return np.sqrt(np.mean(frames**2, axis=1))
+
+
+def iter_chunks(
+    buffers: Iterable[bytes],
+    sample_rate: int = SAMPLE_RATE,
+    min_chunk_seconds: float = DEFAULT_MIN_CHUNK_SECONDS,
+    max_chunk_seconds: float = DEFAULT_MAX_CHUNK_SECONDS,
+) -> Iterator[Tuple[int, bytes]]:
+    """Splits a stream of 16-bit mono PCM into chunks no longer than `max_chunk_seconds`, cutting at the quietest
+    point.
+
+    Yields `(offset, chunk)` tuples where `offset` is the position of the chunk's first sample in the original audio.
+    At most one chunk worth of audio is held in memory at a time.
+    """
+    frame_size = int(sample_rate * FRAME_SECONDS)
+    min_frames = int(min_chunk_seconds / FRAME_SECONDS)
+    max_frames = int(max_chunk_seconds / FRAME_SECONDS)
+    max_chunk_bytes = max_frames * frame_size * SAMPLE_WIDTH_BYTES
+
+    pending = bytearray()
+    offset = 0
+    for buffer in buffers:
+        pending += buffer
+        while len(pending) > max_chunk_bytes:
+            energies = frame_energies(np.frombuffer(pending, dtype=np.int16, count=max_frames * frame_size), frame_size)
+            cut_frame = min_frames + int(np.argmin(energies[min_frames:]))
+            cut_samples = (cut_frame + 1) * frame_size
+
+            yield offset, bytes(pending[: cut_samples * SAMPLE_WIDTH_BYTES])
+
+            del pending[: cut_samples * SAMPLE_WIDTH_BYTES]
+            offset += cut_samples
+
+    if len(pending) > 0:
+        yield offset, bytes(pending)
+
+
+def split_on_silence(
+    pcm: bytes,
+    sample_rate: int = SAMPLE_RATE,
+    min_chunk_seconds: float = DEFAULT_MIN_CHUNK_SECONDS,
+    max_chunk_seconds: float = DEFAULT_MAX_CHUNK_SECONDS,
+) -> List[Tuple[int, bytes]]:
+    """Splits 16-bit mono PCM held in memory into chunks, see `iter_chunks`."""
+    return list(iter_chunks([pcm], sample_rate, min_chunk_seconds, max_chunk_seconds))
+
+
+@dataclass
+class SpeechStats:
+    """Keeps track of how much audio the voice activity detection kept and dropped."""
+
+    total_samples: int = 0
+    speech_samples: int = 0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.total_samples / SAMPLE_RATE
+
+    @property
+    def dropped_seconds(self) -> float:
+        return (self.total_samples - self.speech_samples) / SAMPLE_RATE
+
+
+def detect_speech(
+    buffers: Iterable[bytes],
+    stats: Optional[SpeechStats] = None,
+    sample_rate: int = SAMPLE_RATE,
+    min_silence_seconds: float = DEFAULT_MIN_SILENCE_SECONDS,
+    padding_seconds: float = DEFAULT_SPEECH_PADDING_SECONDS,
+    min_speech_rms: float = DEFAULT_MIN_SPEECH_RMS,
+    calibration_seconds: float = DEFAULT_NOISE_CALIBRATION_SECONDS,
+) -> Iterator[Tuple[int, int, bytes]]:
+    """Energy-based voice activity detection over a stream of 16-bit mono PCM.
+
+    Frames are voiced when they are louder than both `min_speech_rms` and a multiple of the running noise floor. The
+    noise floor is first estimated from the quietest frames of the first `calibration_seconds`, so that quiet
+    recordings (e.g. from low-gain microphones) are judged against their own background noise. Gaps without voiced
+    frames that are longer than `min_silence_seconds` are dropped, keeping `padding_seconds` of context on both sides
+    of the speech.
+
+    Yields `(region, offset, frame)` tuples where `region` numbers each contiguous run of speech and `offset` is the
+    position of the frame's first sample in the original audio.
+    """
+    frame_size = int(sample_rate * FRAME_SECONDS)
+    frame_bytes = frame_size * SAMPLE_WIDTH_BYTES
+    min_silence_frames = int(min_silence_seconds / FRAME_SECONDS)
+    padding_frames = int(padding_seconds / FRAME_SECONDS)
+    calibration_frames = int(calibration_seconds / FRAME_SECONDS)
+    stats = stats if stats is not None else SpeechStats()
+
+    region = -1
+    in_speech = False
+    # Silent frames before the next speech, of which only the padding is kept
+    preroll = deque(maxlen=padding_frames)
+    # Silent frames after speech which are held back until it is known whether the speech continues
+    trailing = []
+
+    def frames(buffers: Iterable[bytes]) -> Iterator[Tuple[int, bytes, float]]:
+        offset = 0
+        pending = bytearray()
+        for buffer in buffers:
+            pending += buffer
+            usable = len(pending) - len(pending) % frame_bytes
+            if usable == 0:
+                continue
+
+            energies = frame_energies(np.frombuffer(bytes(pending[:usable]), dtype=np.int16), frame_size)
+            for index, energy in enumerate(energies):
+                yield offset, bytes(pending[index * frame_bytes : (index + 1) * frame_bytes]), float(energy)
+                offset += frame_size
+            del pending[:usable]
+
+        if len(pending) > 0:
+            yield offset, bytes(pending), 0.0
+
+    all_frames = frames(buffers)
+    calibration = list(itertools.islice(all_frames, calibration_frames))
+    # A trailing partial frame has no energy, so it is left out
+    energies = [energy for _, frame, energy in calibration if len(frame) == frame_bytes]
+    noise_floor = float(np.percentile(energies, NOISE_CALIBRATION_PERCENTILE)) if len(energies) > 0 else 0.0
+
+    for offset, frame, energy in itertools.chain(calibration, all_frames):
+        stats.total_samples += len(frame) // SAMPLE_WIDTH_BYTES
+        voiced = energy > max(min_speech_rms, noise_floor * DEFAULT_SPEECH_TO_NOISE_RATIO)
+        if not voiced:
+            noise_floor = 0.95 * noise_floor + 0.05 * energy
+
+        if not in_speech:
+            if voiced:
+                in_speech = True
+                region += 1
+                for kept in [*preroll, (offset, frame)]:
+                    stats.speech_samples += len(kept[1]) // SAMPLE_WIDTH_BYTES
+                    yield (region, *kept)
+                preroll.clear()
+            else:
+                preroll.append((offset, frame))
+        elif voiced:
+            for kept in [*trailing, (offset, frame)]:
+                stats.speech_samples += len(kept[1]) // SAMPLE_WIDTH_BYTES
+                yield (region, *kept)
+            trailing = []
+        else:
+            trailing.append((offset, frame))
+            if len(trailing) >= min_silence_frames:
+                for kept in trailing[:padding_frames]:
+                    stats.speech_samples += len(kept[1]) // SAMPLE_WIDTH_BYTES
+                    yield (region, *kept)
+                preroll.extend(trailing[len(trailing) - padding_frames :])
+                trailing = []
+                in_speech = False
+
+    for kept in trailing[:padding_frames]:
+        stats.speech_samples += len(kept[1]) // SAMPLE_WIDTH_BYTES
+        yield (region, *kept)
+
+
+def iter_speech_chunks(
+    buffers: Iterable[bytes],
+    stats: Optional[SpeechStats] = None,
+    sample_rate: int = SAMPLE_RATE,
+    min_chunk_seconds: float = DEFAULT_MIN_CHUNK_SECONDS,
+    max_chunk_seconds: float = DEFAULT_MAX_CHUNK_SECONDS,
+) -> Iterator[Tuple[int, bytes]]:
+    """Like `iter_chunks`, but drops the audio without speech so that chunks only cover the speech regions.
+
+    Offsets still refer to the original audio, so timestamps need no further mapping.
+    """
+    speech = detect_speech(buffers, stats=stats, sample_rate=sample_rate)
+    for _, region in itertools.groupby(speech, key=lambda frame: frame[0]):
+        _, region_offset, first_frame = next(region)
+        region_buffers = itertools.chain([first_frame], (frame for _, _, frame in region))
+        for offset, chunk in iter_chunks(region_buffers, sample_rate, min_chunk_seconds, max_chunk_seconds):
+            yield region_offset + offset, chunk
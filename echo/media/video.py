@@ -1,3 +1,5 @@
+from typing import Any, Dict
+
 import ffmpeg
 from pytube import YouTube
 
@@ -9,6 +11,23 @@ def contains_audio(video_file_path) -> bool:
     return any(stream["codec_type"] == "audio" for stream in probe["streams"])
 
 
+def probe_media(file_path) -> Dict[str, Any]:
+    """Uses `ffprobe` to determine the duration (in seconds, if it is known) and the streams of a given media file."""
+    probe = ffmpeg.probe(file_path)
+
+    duration = probe["format"].get("duration")
+    streams = [
+        {key: stream[key] for key in ["codec_type", "codec_name", "sample_rate", "channels"] if key in stream}
+        for stream in probe["streams"]
+    ]
+
+    return {
+        "duration": float(duration) if duration is not None else None,
+        "streams": streams,
+        "has_audio": any(stream["codec_type"] == "audio" for stream in streams),
+    }
+
+
 def is_valid_youtube_url(youtube_url: str) -> bool:
     """Returns whether or not a given string is a valid YouTube URL."""
     try:
@@ -2,15 +2,24 @@ from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
 from echo.authn.session import DEFAULT_USER_ID
 from echo.models.segment import Segment
-from echo.models.utils import to_camelcase
+from echo.models.utils import encode_cursor, to_camelcase
 
+QUALITY_DRAFT = "draft"
+QUALITY_FINAL = "final"
 
-class Echo(SQLModel, table=True):
-    """Represents an audio file that can be transcribed."""
+
+def echo_cursor(created_at: datetime, echo_id: str) -> str:
+    """Position of an Echo when paging through Echoes."""
+    return encode_cursor(created_at.isoformat(), echo_id)
+
+
+class EchoBase(SQLModel):
+    """Fields shared by Echoes and their summaries."""
 
     id: str = Field(primary_key=True)
     # TODO: Use a real foregin key relationship with a `User` model
@@ -19,19 +28,53 @@ class Echo(SQLModel, table=True):
     source_file_path: str
     source_youtube_url: Optional[str] = None
     media_type: str
-    text: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.now)
     completed_transcription_at: Optional[datetime] = None
+    # Length of the source media, used to schedule short Echoes first
+    duration_seconds: Optional[float] = None
+    # Position (in seconds) up to which the audio has been transcribed while recognition is still running
+    transcribed_until: Optional[float] = None
+    # Either `draft` while only the fast first pass is available or `final` once the configured model has finished
+    quality: Optional[str] = None
+    # Name of the `whisper.cpp` model (including its quantization) which produced the text
+    model: Optional[str] = None
 
     class Config:
         alias_generator = to_camelcase
         allow_population_by_field_name = True
 
 
+class EchoSummary(EchoBase):
+    """An Echo without its transcript, which is all that is needed to list Echoes."""
+
+    # Pass as `after` to list the Echoes following this one
+    cursor: Optional[str] = None
+
+
+class Echo(EchoBase, table=True):
+    """Represents an audio file that can be transcribed."""
+
+    __table_args__ = (
+        # Listing the Echoes of a user
+        Index("ix_echo_user_id_created_at", "user_id", "created_at"),
+        # Garbage collection of old Echoes
+        Index("ix_echo_created_at", "created_at"),
+    )
+
+    text: Optional[str] = None
+
+    @property
+    def cursor(self) -> str:
+        return echo_cursor(self.created_at, self.id)
+
+
 class ListEchoesConfig(BaseModel):
     """Used for the `list echoes` command."""
 
     user_id: Optional[str] = None
+    # Cursor of the last Echo of the previous page
+    after: Optional[str] = None
+    limit: Optional[int] = None
 
     class Config:
         alias_generator = to_camelcase
@@ -44,6 +87,9 @@ class GetEchoConfig(BaseModel):
     user_id: Optional[str] = None
     echo_id: str
     include_segments = False
+    # Cursor of the last segment of the previous page
+    segments_after: Optional[str] = None
+    segments_limit: Optional[int] = None
 
     class Config:
         alias_generator = to_camelcase
@@ -55,6 +101,8 @@ class GetEchoResponse(BaseModel):
 
     echo: Optional[Echo] = None
     segments: Optional[List[Segment]] = None
+    # Pass as `segments_after` to get the next page of segments, unset once all segments have been listed
+    segments_cursor: Optional[str] = None
 
     class Config:
         alias_generator = to_camelcase
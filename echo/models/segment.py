@@ -1,11 +1,15 @@
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
-from echo.models.utils import to_camelcase
+from echo.models.utils import encode_cursor, to_camelcase
 
 
 class Segment(SQLModel, table=True):
     """Represents a segment of an audio/video file."""
 
+    # Listing the segments of an Echo in order
+    __table_args__ = (Index("ix_segment_echo_id_start", "echo_id", "start"),)
+
     id: str = Field(primary_key=True)
     seek: int
     start: float
@@ -13,6 +17,11 @@ class Segment(SQLModel, table=True):
     text: str
     echo_id: str = Field(foreign_key="echo.id")
 
+    @property
+    def cursor(self) -> str:
+        """Position of the segment when paging through the segments of an Echo."""
+        return encode_cursor(self.start, self.id)
+
     class Config:
         alias_generator = to_camelcase
         allow_population_by_field_name = True
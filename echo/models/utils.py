@@ -1,5 +1,7 @@
+import base64
 import functools
-from typing import Type
+import json
+from typing import Any, List, Type
 
 from humps.camel import case
 from sqlmodel import SQLModel, inspect
@@ -17,3 +19,21 @@ def get_primary_key(model_type: Type[SQLModel]) -> str:
 
 def to_camelcase(string):
     return case(string)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encodes the sort key of the last row of a page, after which the next page starts.
+
+    The cursor holds the values themselves (instead of e.g. the ID of the row), so it stays valid even if that row is
+    deleted in the meantime.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, count: int) -> List[Any]:
+    """Returns the values of a cursor, raising `ValueError` if it is not a valid cursor of `count` values."""
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list) or len(values) != count:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return values
@@ -36,8 +36,8 @@ export default function EchoesListMobile({ onSelectEchoID }: Props) {
     [deleteEchoMutation],
   );
 
-  const completedEchoes = echoes.filter(echo => echo.text);
-  const pendingEchoes = echoes.filter(echo => !echo.text);
+  const completedEchoes = echoes.filter(echo => echo.completedTranscriptionAt);
+  const pendingEchoes = echoes.filter(echo => !echo.completedTranscriptionAt);
 
   const maxAgeSeconds = process.env.REACT_APP_ECHO_GARBAGE_COLLECTION_MAX_AGE_SECONDS;
   const garbageCollectionWarning = !!maxAgeSeconds
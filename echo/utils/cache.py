@@ -0,0 +1,205 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from lightning.app.storage import Drive
+from lightning.app.utilities.app_helpers import Logger
+
+logger = Logger(__name__)
+
+
+class DiskCache:
+    """Size-bounded cache of files in a local directory which evicts the least recently used entries first.
+
+    If a Drive is given, entries are also shared through it so that other Works can reuse them.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int, drive: Optional[Drive] = None):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._drive = drive
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _get_filepath(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached value for the given key, or `None` if it is not cached locally or on the Drive."""
+        filepath = self._get_filepath(key)
+
+        if not os.path.exists(filepath) and self._drive is not None:
+            try:
+                self._drive.get(filepath, overwrite=True)
+            except Exception:
+                pass
+
+        with self._lock:
+            try:
+                with open(filepath, "rb") as f:
+                    value = f.read()
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+
+            # Modification time is used to track recency of use
+            os.utime(filepath)
+            self.hits += 1
+
+        return value
+
+    def put(self, key: str, value: bytes):
+        filepath = self._get_filepath(key)
+
+        with self._lock:
+            # Write to a temporary file first so readers never see a partially written entry
+            with open(f"{filepath}.tmp", "wb") as f:
+                f.write(value)
+            os.replace(f"{filepath}.tmp", filepath)
+
+            self._evict()
+
+        if self._drive is not None:
+            try:
+                self._drive.put(filepath)
+            except Exception:
+                logger.warn(f"Could not share cache entry {key} on the Drive")
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits into its size budget."""
+        entries = []
+        for name in os.listdir(self.directory):
+            stat = os.stat(self._get_filepath(name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+
+            os.remove(self._get_filepath(name))
+            total_size -= size
+            self.evictions += 1
+
+            if self._drive is not None:
+                try:
+                    self._drive.delete(self._get_filepath(name))
+                except Exception:
+                    logger.warn(f"Could not delete cache entry {name} from the Drive")
+
+
+class FileCache:
+    """Size-bounded local copies of files which are fetched on demand (e.g. from a Drive), evicting the least
+    recently used copies first.
+
+    Files are pinned while in use so they are never evicted in the middle of a download, and concurrent requests for
+    the same missing file share a single fetch. Evicted copies are only removed locally.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int, fetch: Callable[[str], None]):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Fetches the file for a key into the directory
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        # Sizes of the cached files, from the least to the most recently used
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._fetching: Dict[str, Future] = {}
+
+    def _get_filepath(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def acquire(self, key: str) -> str:
+        """Returns the path to the local copy of a file, fetching it if needed.
+
+        The file is pinned until it is released, so every call must be followed by a call to `release`. Copies which
+        were removed behind the back of the cache (e.g. by another Work sharing the directory) are fetched again.
+        """
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+            if key in self._entries:
+                if os.path.exists(self._get_filepath(key)):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._get_filepath(key)
+
+                self.size_bytes -= self._entries.pop(key)
+
+            self.misses += 1
+            fetching = self._fetching.get(key)
+            if fetching is None:
+                fetching = self._fetching[key] = Future()
+                is_leader = True
+            else:
+                is_leader = False
+
+        if not is_leader:
+            try:
+                fetching.result()
+            except Exception:
+                self.release(key)
+                raise
+            return self._get_filepath(key)
+
+        try:
+            self._fetch(key)
+            size = os.path.getsize(self._get_filepath(key))
+        except Exception as e:
+            with self._lock:
+                self._fetching.pop(key)
+            fetching.set_exception(e)
+            self.release(key)
+            raise
+
+        with self._lock:
+            self._fetching.pop(key)
+            self._entries[key] = size
+            self.size_bytes += size
+            self._evict()
+        fetching.set_result(None)
+
+        return self._get_filepath(key)
+
+    def release(self, key: str):
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] == 0:
+                del self._pins[key]
+            self._evict()
+
+    def discard(self, key: str):
+        """Removes the local copy of a file once it is no longer in use, e.g. because it was deleted."""
+        with self._lock:
+            if key in self._entries and key not in self._pins:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        self.size_bytes -= self._entries.pop(key)
+        try:
+            os.remove(self._get_filepath(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Removes the least recently used copies which are not in use until the cache fits into its size budget."""
+        for key in list(self._entries):
+            if self.size_bytes <= self.max_size_bytes:
+                break
+            if key in self._pins:
+                continue
+
+            self._remove(key)
+            self.evictions += 1
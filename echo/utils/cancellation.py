@@ -0,0 +1,69 @@
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable
+
+from lightning.app.utilities.app_helpers import Logger
+
+logger = Logger(__name__)
+
+DEFAULT_CHECK_INTERVAL_SECONDS = 5
+
+
+class JobCancelledError(Exception):
+    """Raised inside a job once it has been cancelled, e.g. because its Echo was deleted."""
+
+
+class CancellationToken:
+    """Tells a long-running job whether it should stop.
+
+    The check (e.g. a request to the database) runs at most once per interval, so jobs can poll the token as often as
+    they like. Once a job is cancelled it stays cancelled.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        is_cancelled: Callable[[], bool],
+        interval_seconds: float = DEFAULT_CHECK_INTERVAL_SECONDS,
+    ):
+        self.job_id = job_id
+        self.interval_seconds = interval_seconds
+
+        self._is_cancelled = is_cancelled
+        self._checked_at = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def cancelled(self, force: bool = False) -> bool:
+        """Returns whether the job was cancelled, only running the check if the interval has passed (or if forced)."""
+        with self._lock:
+            now = time.monotonic()
+            due = self._checked_at is None or now - self._checked_at >= self.interval_seconds
+            if self._cancelled or not (force or due):
+                return self._cancelled
+
+            self._checked_at = now
+            try:
+                self._cancelled = self._is_cancelled()
+            except Exception as e:
+                # Keep going if the check itself fails, it will be retried after the next interval
+                logger.warn(f"Could not check whether job {self.job_id} was cancelled: {e}")
+
+            return self._cancelled
+
+    def raise_if_cancelled(self, force: bool = False):
+        if self.cancelled(force=force):
+            raise JobCancelledError(f"Job {self.job_id} was cancelled")
+
+    def wait(self, future: Future) -> Any:
+        """Waits for the result of a future, checking whether the job was cancelled in the meantime."""
+        while True:
+            try:
+                return future.result(timeout=self.interval_seconds)
+            except FutureTimeoutError:
+                self.raise_if_cancelled()
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+DEFAULT_READ_SIZE = 64 * 1024
+# Each Echo has its own media file which never changes, so clients can keep it for as long as they like
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# More ranges than this (after merging) are answered with the whole file, so a short header cannot make the server send
+# the same bytes over and over again (see RFC 7233, section 6.1)
+MAX_RANGES = 16
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested byte ranges overlap with the file."""
+
+
+def make_etag(*parts) -> str:
+    """Returns a strong ETag derived from the given parts, which together must identify the content."""
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+
+    return f'"{digest[:32]}"'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parses a `Range` header into a sorted list of `(start, end)` byte positions, where `end` is inclusive.
+
+    Overlapping and adjacent ranges are merged. Returns `None` if the header is missing or invalid, or if it asks for
+    more than `MAX_RANGES` ranges, in which case the whole file is sent (see RFC 7233).
+    """
+    if header is None or not header.startswith("bytes="):
+        return None
+
+    ranges = []
+    for spec in header[len("bytes=") :].split(","):
+        start, separator, end = spec.strip().partition("-")
+        if separator != "-" or not all(bound.isdigit() for bound in [start, end] if bound != "") or start == end == "":
+            return None
+
+        if start == "":
+            # Suffix range, i.e. the last bytes of the file
+            if int(end) == 0:
+                continue
+            ranges.append((max(0, size - int(end)), size - 1))
+        elif int(start) < size:
+            if end != "" and int(end) < int(start):
+                return None
+            ranges.append((int(start), min(size - 1, int(end)) if end != "" else size - 1))
+
+    if len(ranges) == 0:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+
+    merged = []
+    for start, end in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged if len(merged) <= MAX_RANGES else None
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """Returns whether an ETag matches any of the ones listed in an `If-None-Match` or `If-Range` header."""
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+
+    def normalize(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if weak and tag.startswith("W/") else tag
+
+    return any(normalize(tag) == normalize(etag) for tag in header.split(","))
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, last_modified: float) -> bool:
+    """Evaluates the conditional headers of a GET request, where `If-None-Match` takes precedence."""
+    if "if-none-match" in headers:
+        return etag_matches(headers["if-none-match"], etag)
+
+    if "if-modified-since" in headers:
+        try:
+            since = parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+
+    return False
+
+
+def _read_range(path: str, start: int, end: int, read_size: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            buffer = f.read(min(read_size, remaining))
+            if not buffer:
+                return
+            remaining -= len(buffer)
+            yield buffer
+
+
+def file_response(
+    path: str,
+    request_headers: Mapping[str, str],
+    media_type: str,
+    etag: str,
+    last_modified: float,
+    filename: Optional[str] = None,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL,
+    read_size: int = DEFAULT_READ_SIZE,
+    background: Optional[BackgroundTask] = None,
+) -> Response:
+    """Sends a file, or only the requested byte ranges of it, unless the client already has the same version.
+
+    The validators (`etag` and the `last_modified` timestamp) must identify the version of the stored file, rather than
+    of this copy of it, which may have been fetched again since.
+    Multiple ranges are sent as `multipart/byteranges`. The `background` task runs once the response was sent (or the
+    client disconnected).
+    """
+    stat = os.stat(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": cache_control,
+    }
+
+    if is_not_modified(request_headers, etag, last_modified):
+        return Response(status_code=304, headers=headers, background=background)
+
+    ranges = None
+    # A range of an outdated version would be mixed with the new version, so send the whole file instead
+    if "if-range" not in request_headers or etag_matches(request_headers["if-range"], etag, weak=False):
+        try:
+            ranges = parse_range(request_headers.get("range"), stat.st_size)
+        except RangeNotSatisfiable as e:
+            return Response(status_code=416, headers={**headers, "Content-Range": str(e)}, background=background)
+
+    if ranges is None:
+        return FileResponse(
+            path=path,
+            filename=filename,
+            media_type=media_type,
+            headers=headers,
+            stat_result=stat,
+            background=background,
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _read_range(path, start, end, read_size),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+            background=background,
+        )
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (
+            f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{stat.st_size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(
+        sum(len(part) + end - start + 1 for part, (start, end) in zip(parts, ranges))
+        + 2 * (len(ranges) - 1)
+        + len(closing)
+    )
+
+    def multipart() -> Iterator[bytes]:
+        for index, (part, (start, end)) in enumerate(zip(parts, ranges)):
+            yield (b"\r\n" if index > 0 else b"") + part
+            yield from _read_range(path, start, end, read_size)
+        yield closing
+
+    return StreamingResponse(
+        multipart(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+        background=background,
+    )
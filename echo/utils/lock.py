@@ -0,0 +1,50 @@
+import collections
+import threading
+from typing import Deque
+
+
+class FairLock:
+    """A lock which is acquired in the order it was requested.
+
+    `threading.Lock` lets a thread which releases the lock take it again right away, before any of the threads waiting
+    for it are scheduled, so under sustained contention some threads may wait indefinitely. This lock hands itself over
+    to the longest waiting thread instead.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._waiters: Deque[threading.Lock] = collections.deque()
+        self._locked = False
+
+    def acquire(self):
+        with self._mutex:
+            if not self._locked:
+                self._locked = True
+                return
+
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+
+        # Released by the thread handing the lock over, which leaves it locked on our behalf
+        waiter.acquire()
+
+    def release(self):
+        with self._mutex:
+            if not self._locked:
+                raise RuntimeError("Cannot release an unlocked lock")
+
+            if len(self._waiters) > 0:
+                self._waiters.popleft().release()
+            else:
+                self._locked = False
+
+    def locked(self) -> bool:
+        return self._locked
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
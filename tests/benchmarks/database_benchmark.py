@@ -0,0 +1,205 @@
+"""Benchmark of the database server under concurrent load from recognizers and clients.
+
+Writer threads behave like recognizers saving the segments of each transcribed chunk and updating the progress of
+their Echo, while reader threads behave like clients polling an Echo with its segments. The handlers of the database
+server are called directly from a thread pool, like FastAPI runs them, so the HTTP layer is not part of the numbers.
+
+Each configuration runs against a new database file which is seeded first, reporting the throughput, latencies and
+errors (e.g. `database is locked`) of reads and writes as JSON.
+
+Usage:
+
+    python -m tests.benchmarks.database_benchmark --writers 8 --readers 32 --seconds 30 --output results.json
+
+Pass `--engines tuned default` to compare with the default SQLite settings (rollback journal, one pool for all).
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from sqlmodel import SQLModel, create_engine
+
+from echo.components.database import server
+from echo.models.echo import Echo
+from echo.models.general import GeneralModel
+from echo.models.segment import Segment
+
+DEFAULT_WRITERS = 8
+DEFAULT_READERS = 32
+DEFAULT_SECONDS = 30
+DEFAULT_SEED_ECHOES = 200
+DEFAULT_SEED_SEGMENTS = 500
+# Segments saved per transcribed chunk of audio
+SEGMENTS_PER_WRITE = 10
+ENGINES = ["tuned", "default"]
+
+
+def make_segments(echo_id: str, first: int, count: int) -> List[Segment]:
+    return [
+        Segment(
+            id=f"{echo_id}-{index}",
+            echo_id=echo_id,
+            text="lorem ipsum dolor sit amet " * 4,
+            seek=index * 3000,
+            start=index * 3.0,
+            end=index * 3.0 + 2.5,
+        )
+        for index in range(first, first + count)
+    ]
+
+
+def setup(engine: str, db_file_name: str):
+    if engine == "tuned":
+        server.create_engine(db_file_name, [Echo, Segment], echo=False)
+        return
+
+    server.engine = server.read_engine = create_engine(f"sqlite:///{db_file_name}")
+    # Writers contend for the database lock of SQLite instead of taking turns
+    server.write_lock = contextlib.nullcontext()
+    SQLModel.metadata.create_all(server.engine)
+
+
+def seed(echoes: int, segments: int) -> List[str]:
+    echo_ids = []
+    for index in range(echoes):
+        echo = Echo(id=f"seed-{index}", user_id=f"user-{index % 10}", source_file_path="", media_type="audio/mpeg")
+        server.general_post(GeneralModel.from_obj(echo))
+        server.create_segments_for_echo(make_segments(echo.id, 0, segments))
+        echo_ids.append(echo.id)
+
+    return echo_ids
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def measure(self, operation: Callable[[], Any]):
+        start = time.perf_counter()
+        try:
+            operation()
+        except Exception as e:
+            with self._lock:
+                self.errors[type(e).__name__] = self.errors.get(type(e).__name__, 0) + 1
+            return
+
+        with self._lock:
+            self.latencies.append(time.perf_counter() - start)
+
+    def report(self, seconds: float) -> Dict[str, Any]:
+        latencies = np.array(self.latencies or [0.0]) * 1000
+        return {
+            "operations": len(self.latencies),
+            "per_second": round(len(self.latencies) / seconds, 1),
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 2),
+                "p99": round(float(np.percentile(latencies, 99)), 2),
+                "max": round(float(latencies.max()), 2),
+            },
+            "errors": self.errors,
+        }
+
+
+def benchmark(engine: str, writers: int, readers: int, seconds: float, seed_echoes: int, seed_segments: int):
+    with tempfile.TemporaryDirectory() as directory:
+        setup(engine, os.path.join(directory, "database.db"))
+        echo_ids = seed(seed_echoes, seed_segments)
+
+        writes, reads = Recorder(), Recorder()
+        deadline = time.perf_counter() + seconds
+
+        def recognizer(worker: int):
+            while time.perf_counter() < deadline:
+                echo = Echo(
+                    id=f"echo-{worker}-{time.perf_counter_ns()}",
+                    user_id="user-0",
+                    source_file_path="",
+                    media_type="audio/mpeg",
+                )
+                writes.measure(lambda: server.general_post(GeneralModel.from_obj(echo)))
+                for chunk in range(10):
+                    if time.perf_counter() >= deadline:
+                        break
+                    segments = make_segments(echo.id, chunk * SEGMENTS_PER_WRITE, SEGMENTS_PER_WRITE)
+                    echo.transcribed_until = segments[-1].end
+                    writes.measure(lambda: server.create_segments_for_echo(segments))
+                    writes.measure(lambda: server.general_put(GeneralModel.from_obj(echo)))
+
+        def client():
+            while time.perf_counter() < deadline:
+                echo_id = random.choice(echo_ids)
+                reads.measure(lambda: server.get_echo(echo_id))
+                reads.measure(lambda: server.list_segments_for_echo(echo_id))
+
+        threads = [threading.Thread(target=recognizer, args=(worker,)) for worker in range(writers)]
+        threads += [threading.Thread(target=client) for _ in range(readers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        server.engine.dispose()
+        server.read_engine.dispose()
+
+    return {
+        "engine": engine,
+        "writers": writers,
+        "readers": readers,
+        "seconds": round(elapsed, 1),
+        "writes": writes.report(elapsed),
+        "reads": reads.report(elapsed),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=["tuned"])
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITERS, help="Concurrent recognizers")
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS, help="Concurrent clients")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS)
+    parser.add_argument("--seed-echoes", type=int, default=DEFAULT_SEED_ECHOES)
+    parser.add_argument("--seed-segments", type=int, default=DEFAULT_SEED_SEGMENTS, help="Segments per seeded Echo")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = []
+    for engine in args.engines:
+        result = benchmark(engine, args.writers, args.readers, args.seconds, args.seed_echoes, args.seed_segments)
+        print(
+            f"{engine}: {result['writes']['per_second']} writes/s, {result['reads']['per_second']} reads/s",
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    report = {
+        "environment": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
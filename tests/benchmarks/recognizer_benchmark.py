@@ -0,0 +1,244 @@
+"""Offline benchmark of the speech recognition pipeline.
+
+Generates synthetic fixtures locally and runs them through `SpeechRecognizer` for every combination of model size and
+threads per engine, reporting the real-time factor, peak memory and the time spent in each stage as JSON.
+
+Usage:
+
+    python -m tests.benchmarks.recognizer_benchmark --model-sizes tiny base --threads 2 4 --output results.json
+
+Pass `--baseline` with the output of a previous run to fail when the real-time factor regresses.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from echo.components.recognizer import SpeechRecognizer
+from echo.media.audio import SAMPLE_RATE, SpeechStats
+from echo.models.segment import Segment
+
+DEFAULT_DURATIONS_SECONDS = [30, 120, 600]
+DEFAULT_MODEL_SIZES = ["tiny"]
+DEFAULT_THREADS = [4]
+DEFAULT_FIXTURES_DIRECTORY = os.path.join(".benchmarks", "fixtures")
+DEFAULT_REGRESSION_TOLERANCE = 0.2
+FIXTURE_KINDS = ["speech", "tone"]
+FIXTURE_SEED = 42
+
+
+def synthesize_speech(seconds: float, seed: int = FIXTURE_SEED) -> np.ndarray:
+    """Returns 16-bit mono samples that resemble speech closely enough to exercise the pipeline.
+
+    Voiced "syllables" (harmonic tones with a varying pitch and a smooth envelope) are grouped into phrases separated by
+    pauses, on top of low background noise.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    samples = rng.normal(0, 30, total)
+
+    position = 0
+    while position < total:
+        for _ in range(rng.integers(3, 12)):
+            length = int(rng.uniform(0.08, 0.25) * SAMPLE_RATE)
+            t = np.arange(min(length, total - position)) / SAMPLE_RATE
+            pitch = rng.uniform(100, 250)
+            syllable = sum(np.sin(2 * np.pi * pitch * harmonic * t) / harmonic for harmonic in range(1, 5))
+            samples[position : position + len(t)] += 6000 * np.hanning(len(t)) * syllable
+            position += len(t) + int(rng.uniform(0.02, 0.08) * SAMPLE_RATE)
+        position += int(rng.uniform(0.4, 2.5) * SAMPLE_RATE)
+
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+def synthesize_tone(seconds: float) -> np.ndarray:
+    """Returns 16-bit mono samples of a continuous 440 Hz tone, i.e. audio without any pauses."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def create_fixture(directory: str, kind: str, seconds: int) -> str:
+    """Encodes a synthetic fixture as AAC (like most uploads and YouTube videos), reusing it if it already exists."""
+    filepath = os.path.join(directory, f"{kind}-{seconds}s.m4a")
+    if os.path.exists(filepath):
+        return filepath
+
+    samples = synthesize_speech(seconds) if kind == "speech" else synthesize_tone(seconds)
+
+    os.makedirs(directory, exist_ok=True)
+    commands = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y"]
+    commands += ["-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0", "-c:a", "aac", filepath]
+    subprocess.run(commands, input=samples.tobytes(), check=True)
+
+    return filepath
+
+
+def _peak_rss_mb(who: int) -> float:
+    # NOTE: `ru_maxrss` is in kilobytes on Linux but in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def benchmark(fixture_path: str, model_size: str, threads: int, vad_enabled: bool) -> Dict[str, Any]:
+    """Runs one fixture through the recognizer and measures each stage of the pipeline.
+
+    Meant to run in a fresh process so that the peak memory only covers a single configuration.
+    """
+    recognizer = SpeechRecognizer(model_size=model_size)
+    recognizer.threads_per_engine = threads
+    recognizer.vad_enabled = vad_enabled
+    recognizer.cache_max_size_mb = 0
+
+    stages: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    recognizer.start_engine()
+    stages["engine_startup"] = time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        pcm = list(recognizer.convert_to_audio(fixture_path))
+        stages["convert_to_audio"] = time.perf_counter() - start
+
+        # NOTE: `recognize` is `split_audio` followed by `transcribe_chunks`, which are timed separately here
+        speech_stats = SpeechStats()
+        start = time.perf_counter()
+        chunks = list(recognizer.split_audio(pcm, speech_stats=speech_stats))
+        stages["split_audio"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = list(recognizer.transcribe_chunks(chunks, recognizer._engine))
+        stages["transcribe"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        segments = [
+            Segment(
+                id=f"benchmark-{segment['id']}",
+                echo_id="benchmark",
+                text=segment["text"],
+                seek=segment["seek"],
+                start=segment["start"],
+                end=segment["end"],
+            )
+            for result in results
+            for segment in result["segments"]
+        ]
+        text = "\n".join(segment.text for segment in segments)
+        stages["build_segments"] = time.perf_counter() - start
+
+        engines = recognizer._engine.size
+    finally:
+        recognizer.on_exit()
+
+    audio_seconds = sum(len(buffer) for buffer in pcm) / (2 * SAMPLE_RATE)
+    # Model loading is paid once per Work rather than per Echo, so it is not part of the real-time factor
+    processing_seconds = sum(seconds for stage, seconds in stages.items() if stage != "engine_startup")
+
+    return {
+        "fixture": os.path.basename(fixture_path),
+        "audio_seconds": audio_seconds,
+        "model_size": model_size,
+        "threads_per_engine": threads,
+        "engines": engines,
+        "vad_enabled": vad_enabled,
+        "chunks": len(chunks),
+        "segments": len(segments),
+        "characters": len(text),
+        "speech_seconds": audio_seconds - speech_stats.dropped_seconds if vad_enabled else audio_seconds,
+        "stages": {stage: round(seconds, 3) for stage, seconds in stages.items()},
+        "processing_seconds": round(processing_seconds, 3),
+        "real_time_factor": round(processing_seconds / audio_seconds, 4),
+        "peak_rss_mb": {
+            "benchmark": round(_peak_rss_mb(resource.RUSAGE_SELF), 1),
+            # Largest of the `whisper.cpp` servers and `ffmpeg` processes, which have all exited at this point
+            "subprocesses": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        },
+    }
+
+
+def find_regressions(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float = DEFAULT_REGRESSION_TOLERANCE
+) -> List[str]:
+    """Compares the real-time factor of each configuration with a previous run."""
+
+    def key(result: Dict[str, Any]):
+        return result["fixture"], result["model_size"], result["threads_per_engine"], result["vad_enabled"]
+
+    previous = {key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        if key(result) not in previous:
+            continue
+
+        before, after = previous[key(result)]["real_time_factor"], result["real_time_factor"]
+        if after > before * (1 + tolerance):
+            regressions.append(f"{' / '.join(str(part) for part in key(result))}: {before} -> {after}")
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-sizes", nargs="+", default=DEFAULT_MODEL_SIZES)
+    parser.add_argument("--threads", nargs="+", type=int, default=DEFAULT_THREADS, help="Threads per engine")
+    parser.add_argument("--durations", nargs="+", type=int, default=DEFAULT_DURATIONS_SECONDS, help="In seconds")
+    parser.add_argument("--kinds", nargs="+", choices=FIXTURE_KINDS, default=FIXTURE_KINDS)
+    parser.add_argument("--no-vad", action="store_true", help="Disable voice activity detection")
+    parser.add_argument("--fixtures-directory", default=DEFAULT_FIXTURES_DIRECTORY)
+    parser.add_argument("--output", help="Write the results to this file instead of stdout")
+    parser.add_argument("--baseline", help="Results of a previous run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    fixtures = [
+        create_fixture(args.fixtures_directory, kind, seconds) for kind in args.kinds for seconds in args.durations
+    ]
+
+    results = []
+    # NOTE: Every configuration runs in a new process, otherwise the peak memory would only ever go up
+    context = multiprocessing.get_context("spawn")
+    for model_size in args.model_sizes:
+        for threads in args.threads:
+            for fixture in fixtures:
+                with context.Pool(1) as pool:
+                    result = pool.apply(benchmark, (fixture, model_size, threads, not args.no_vad))
+                print(
+                    f"{result['fixture']} ({model_size}, {threads} threads): RTF {result['real_time_factor']}",
+                    file=sys.stderr,
+                )
+                results.append(result)
+
+    report = {
+        "environment": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f)["results"], tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"Real-time factor regressed: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
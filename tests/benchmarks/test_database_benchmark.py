@@ -0,0 +1,12 @@
+import pytest
+
+from .database_benchmark import benchmark
+
+
+@pytest.mark.parametrize("engine", ["tuned", "default"])
+def test_benchmark_runs_without_errors(engine):
+    result = benchmark(engine, writers=2, readers=2, seconds=0.5, seed_echoes=5, seed_segments=20)
+
+    assert result["writes"]["operations"] > 0
+    assert result["reads"]["operations"] > 0
+    assert result["writes"]["errors"] == {} and result["reads"]["errors"] == {}
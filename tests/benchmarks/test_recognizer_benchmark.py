@@ -0,0 +1,36 @@
+import os
+import shutil
+
+import pytest
+
+from echo.media.audio import SAMPLE_RATE, SpeechStats, iter_speech_chunks
+from echo.media.video import contains_audio
+from .recognizer_benchmark import create_fixture, find_regressions, synthesize_speech
+
+
+def test_synthesize_speech_has_pauses():
+    samples = synthesize_speech(60)
+    stats = SpeechStats()
+
+    chunks = list(iter_speech_chunks([samples.tobytes()], stats=stats))
+
+    assert len(samples) == 60 * SAMPLE_RATE
+    assert len(chunks) > 0
+    assert 0 < stats.dropped_seconds < 60
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="requires ffmpeg")
+def test_create_fixture(tmpdir):
+    filepath = create_fixture(str(tmpdir), "tone", 5)
+
+    assert os.path.basename(filepath) == "tone-5s.m4a"
+    assert contains_audio(filepath)
+    assert create_fixture(str(tmpdir), "tone", 5) == filepath
+
+
+def test_find_regressions():
+    result = {"fixture": "speech-30s.m4a", "model_size": "tiny", "threads_per_engine": 4, "vad_enabled": True}
+    baseline = [{**result, "real_time_factor": 0.1}]
+
+    assert find_regressions([{**result, "real_time_factor": 0.11}], baseline, tolerance=0.2) == []
+    assert len(find_regressions([{**result, "real_time_factor": 0.2}], baseline, tolerance=0.2)) == 1
@@ -0,0 +1,14 @@
+import pytest
+
+from echo.components.database import server
+from echo.models.echo import Echo
+from echo.models.segment import Segment
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Points the handlers of the database server at a new database."""
+    server.create_engine(str(tmp_path / "database.db"), [Echo, Segment], echo=False)
+    yield
+    server.engine.dispose()
+    server.read_engine.dispose()
@@ -0,0 +1,63 @@
+import functools
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import create_engine
+
+from echo.components.database import server
+from echo.components.database.migrations import MIGRATIONS, get_schema_version, migrate
+from echo.models.echo import Echo
+from echo.models.segment import Segment
+
+
+def test_migrate_upgrades_existing_database_in_place(tmp_path):
+    db_path = tmp_path / "database.db"
+    # Schema from before any of the migrations
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(
+            "CREATE TABLE echo (id VARCHAR PRIMARY KEY, user_id VARCHAR, source_file_path VARCHAR, media_type VARCHAR,"
+            " created_at DATETIME)"
+        )
+        connection.execute(
+            'CREATE TABLE segment (id VARCHAR PRIMARY KEY, seek INTEGER, start FLOAT, "end" FLOAT, text VARCHAR,'
+            " echo_id VARCHAR)"
+        )
+        connection.execute("INSERT INTO echo VALUES ('echo', 'user', 'path', 'audio/mpeg', '2023-01-01 00:00:00')")
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    migrate(engine)
+
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == len(MIGRATIONS)
+        assert connection.execute(text("SELECT quality FROM echo WHERE id = 'echo'")).scalar() is None
+        plan = connection.execute(
+            text("EXPLAIN QUERY PLAN SELECT * FROM segment WHERE echo_id = 'echo' ORDER BY start")
+        )
+        assert "ix_segment_echo_id_start" in " ".join(str(row) for row in plan)
+
+
+def test_migrate_only_runs_new_migrations(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'database.db'}")
+    runs = []
+
+    migrate(engine, migrations=[lambda connection: runs.append(1)])
+    migrate(engine, migrations=[lambda connection: runs.append(1), lambda connection: runs.append(2)])
+
+    assert runs == [1, 2]
+
+
+def test_create_engine_fails_on_failed_migration(tmp_path, monkeypatch):
+    def failing_migration(connection):
+        connection.execute(text("ALTER TABLE echo ADD COLUMN text VARCHAR"))
+
+    monkeypatch.setattr(server, "migrate", functools.partial(migrate, migrations=[*MIGRATIONS, failing_migration]))
+
+    with pytest.raises(OperationalError):
+        server.create_engine(str(tmp_path / "database.db"), [Echo, Segment], echo=False)
+
+    with server.engine.connect() as connection:
+        assert get_schema_version(connection) == len(MIGRATIONS)
+    server.engine.dispose()
+    server.read_engine.dispose()
@@ -0,0 +1,170 @@
+import socket
+import threading
+import time
+from datetime import datetime
+
+import pytest
+import requests
+import uvicorn
+from fastapi import HTTPException
+
+from echo.components.database import server
+from echo.components.database.client import DatabaseClient
+from echo.models.echo import Echo
+from echo.models.general import GeneralModel
+from echo.models.segment import Segment
+
+
+@pytest.fixture
+def database_url(database):
+    """Serves the database over HTTP, like the `Database` Work does."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    http_server = uvicorn.Server(uvicorn.Config(server.create_app(), host="127.0.0.1", port=port, log_level="error"))
+    thread = threading.Thread(target=http_server.run)
+    thread.start()
+    while not http_server.started:
+        time.sleep(0.01)
+
+    yield f"http://127.0.0.1:{port}"
+
+    http_server.should_exit = True
+    thread.join()
+
+
+def create_echo(echo_id: str, segments: int = 3):
+    echo = Echo(id=echo_id, user_id="user", source_file_path="", media_type="audio/mpeg")
+    server.general_post(GeneralModel.from_obj(echo))
+    server.create_segments_for_echo(
+        [
+            Segment(id=f"{echo_id}-{index}", echo_id=echo_id, text="", seek=0, start=index, end=index + 1)
+            for index in range(segments)
+        ]
+    )
+
+
+def test_delete_echoes_deletes_segments(database, monkeypatch):
+    # Force several batches
+    monkeypatch.setattr(server, "MAX_PARAMETERS_PER_STATEMENT", 2)
+    for index in range(5):
+        create_echo(f"echo-{index}")
+
+    server.delete_echoes(["echo-0", "echo-1", "echo-2", "echo-3", "missing"])
+
+    assert [echo.id for echo in server.list_echoes(None, None)] == ["echo-4"]
+    assert server.list_segments_for_echo("echo-0") == []
+    assert len(server.list_segments_for_echo("echo-4")) == 3
+
+
+def test_delete_echo_is_idempotent(database):
+    create_echo("echo")
+
+    server.delete_echo("echo")
+    server.delete_echo("echo")
+
+    assert server.get_echo("echo") is None
+    assert server.list_segments_for_echo("echo") == []
+
+
+def test_list_echoes_pages_with_cursor(database):
+    created_at = datetime(2023, 1, 1)
+    # Echoes created at the same time are ordered by ID
+    for echo_id in ["c", "a", "b"]:
+        server.general_post(
+            GeneralModel.from_obj(Echo(id=echo_id, source_file_path="", media_type="audio/mpeg", created_at=created_at))
+        )
+    server.general_post(
+        GeneralModel.from_obj(Echo(id="0", source_file_path="", media_type="audio/mpeg", created_at=datetime.now()))
+    )
+
+    pages, after = [], None
+    while True:
+        page = server.list_echoes(after=after, limit=2)
+        if len(page) == 0:
+            break
+        pages.append([echo.id for echo in page])
+        after = page[-1].cursor
+
+    assert pages == [["0", "c"], ["b", "a"]]
+
+
+def test_list_segments_for_echo_pages_with_cursor(database):
+    create_echo("echo", segments=5)
+
+    first_page = server.list_segments_for_echo("echo", limit=3)
+    second_page = server.list_segments_for_echo("echo", after=first_page[-1].cursor, limit=3)
+
+    assert [segment.start for segment in first_page + second_page] == [0, 1, 2, 3, 4]
+
+
+def test_list_echoes_pages_after_deleted_cursor(database):
+    for echo_id in ["e0", "e1", "e2", "e3"]:
+        create_echo(echo_id)
+
+    first_page = server.list_echoes(limit=2)
+    server.delete_echo(first_page[-1].id)
+    second_page = server.list_echoes(after=first_page[-1].cursor, limit=2)
+
+    assert [echo.id for echo in first_page + second_page] == ["e3", "e2", "e1", "e0"]
+
+
+def test_list_echo_summaries_pages_over_http(database_url):
+    for echo_id in ["e0", "e1", "e2", "e3", "e4"]:
+        create_echo(echo_id)
+
+    pages, after = [], None
+    while True:
+        resp = requests.get(f"{database_url}/echoes/summaries/", params={"after": after, "limit": 2})
+        assert resp.status_code == 200
+        if len(resp.json()) == 0:
+            break
+        pages.append([echo["id"] for echo in resp.json()])
+        after = resp.json()[-1]["cursor"]
+
+    assert pages == [["e4", "e3"], ["e2", "e1"], ["e0"]]
+
+
+def test_list_segments_for_echo_pages_over_http(database_url):
+    create_echo("echo", segments=5)
+    client = DatabaseClient(model=Segment, db_url=database_url)
+
+    first_page = client.list_segments_for_echo("echo", limit=3)
+    second_page = client.list_segments_for_echo("echo", after=first_page[-1].cursor, limit=3)
+
+    assert [segment.start for segment in first_page + second_page] == [0, 1, 2, 3, 4]
+
+
+def test_list_echoes_rejects_invalid_cursor(database):
+    with pytest.raises(HTTPException) as error:
+        server.list_echoes(after="not a cursor")
+
+    assert error.value.status_code == 400
+
+
+def test_count_echoes_and_summaries(database):
+    create_echo("echo")
+    server.general_post(
+        GeneralModel.from_obj(
+            Echo(id="other", user_id="other", source_file_path="", media_type="audio/mpeg", text="transcript")
+        )
+    )
+
+    assert server.count_echoes() == 2
+    assert server.count_echoes(user_id="other") == 1
+
+    summaries = server.list_echo_summaries(user_id="other")
+    assert [summary.id for summary in summaries] == ["other"]
+    assert "text" not in summaries[0].dict()
+
+
+def test_create_segments_for_deleted_echo(database):
+    create_echo("echo")
+    server.delete_echo("echo")
+
+    with pytest.raises(HTTPException) as e:
+        server.create_segments_for_echo([Segment(id="echo-0", echo_id="echo", text="", seek=0, start=0, end=1)])
+
+    assert e.value.status_code == 404
+    assert server.list_segments_for_echo("echo") == []
@@ -1,8 +1,12 @@
+import time
+from typing import Optional
+
 import pytest
 from lightning import LightningApp, LightningFlow, LightningWork
 from lightning.app.runners import MultiProcessRuntime
+from lightning.app.utilities.enum import CacheCallsKeys, WorkStageStatus
 
-from echo.components.loadbalancing.loadbalancer import LoadBalancer
+from echo.components.loadbalancing.loadbalancer import LoadBalancer, QueuedCall
 from echo.utils.status import pending_calls
 
 
@@ -69,3 +73,57 @@ def test_loadbalancer(test_name, min_replicas, max_pending_calls_per_work, max_i
     )
 
     MultiProcessRuntime(app).dispatch()
+
+
+class SlottedTestWork(TestWork):
+    def __init__(self, slots: int, free_slots: Optional[int], pending_cost: float = 0.0, ready: bool = True):
+        super().__init__()
+        self.slots = slots
+        self.free_slots = free_slots
+        self.pending_cost = pending_cost
+        self.ready = ready
+
+    def set_stage(self, stage: str):
+        self._calls[CacheCallsKeys.LATEST_CALL_HASH] = "call"
+        self._calls["call"] = {"statuses": [{"stage": stage, "timestamp": time.time()}]}
+
+
+@pytest.mark.parametrize(
+    "free_slots, expected_capacity",
+    [
+        # Works which do not report their slots yet fall back to `max_pending_calls_per_work`
+        (None, 5),
+        (0, 0),
+        (3, 3),
+    ],
+)
+def test_loadbalancer_free_capacity(free_slots: Optional[int], expected_capacity: int):
+    loadbalancer = LoadBalancer(max_pending_calls_per_work=5, create_work=lambda: TestWork())
+
+    assert loadbalancer._free_capacity(SlottedTestWork(slots=4, free_slots=free_slots)) == expected_capacity
+
+
+def test_queued_call_priority_favours_short_calls_with_aging():
+    long_call = QueuedCall(cost=900, args=(), kwargs={}, queued_at=0)
+
+    def most_urgent(short_call: QueuedCall, now: float) -> QueuedCall:
+        return min([long_call, short_call], key=lambda call: call.priority(aging_rate=1.0, now=now))
+
+    assert most_urgent(QueuedCall(cost=10, args=(), kwargs={}, queued_at=100), now=100).cost == 10
+    # Long calls are not starved by a steady stream of short ones
+    assert most_urgent(QueuedCall(cost=10, args=(), kwargs={}, queued_at=1000), now=1000) is long_call
+
+
+@pytest.mark.parametrize("stage", [WorkStageStatus.SUCCEEDED, WorkStageStatus.RUNNING])
+def test_loadbalancer_selects_least_loaded_ready_work(stage: str):
+    loadbalancer = LoadBalancer(create_work=lambda: TestWork())
+    works = {
+        "busy": SlottedTestWork(slots=4, free_slots=2, pending_cost=600),
+        "idle": SlottedTestWork(slots=4, free_slots=2, pending_cost=60),
+        "cold": SlottedTestWork(slots=4, free_slots=4, ready=False),
+    }
+    for work in works.values():
+        work.set_stage(stage)
+    loadbalancer._work_pool = works
+
+    assert loadbalancer._select_work() is works["idle"]
@@ -0,0 +1,137 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from email.utils import formatdate
+
+import pytest
+from fastapi import HTTPException
+from lightning.app.storage import Drive
+
+from echo.components.fileserver import FileServer, copy_file
+
+
+class LocalDrive(Drive):
+    """Stores the files which are put on the Drive in another local directory."""
+
+    def __init__(self, directory: str, storage: str):
+        super().__init__("lit://files")
+        self.directory = directory
+        self.storage = storage
+
+    def put(self, path: str):
+        os.makedirs(os.path.dirname(os.path.join(self.storage, path)), exist_ok=True)
+        shutil.copy(os.path.join(self.directory, path), os.path.join(self.storage, path))
+
+    def get(self, path: str, **kwargs):
+        shutil.copy(os.path.join(self.storage, path), os.path.join(self.directory, path))
+
+
+@pytest.fixture
+def drive(tmp_path) -> LocalDrive:
+    (tmp_path / "fileserver").mkdir()
+    return LocalDrive(str(tmp_path), storage=str(tmp_path / "drive"))
+
+
+@pytest.mark.parametrize("max_size", [1, 1024 * 1024], ids=["on_disk", "in_memory"])
+def test_copy_file_from_spooled_upload(tmp_path, max_size):
+    content = bytes(range(256)) * 1000
+    src = tempfile.SpooledTemporaryFile(max_size=max_size)
+    src.write(content)
+    src.seek(0)
+
+    progress = []
+    with open(tmp_path / "out", "wb") as dst:
+        copy_file(src, dst, on_progress=progress.append, buffer_size=4096)
+
+    assert (tmp_path / "out").read_bytes() == content
+    assert sum(progress) == len(content)
+    assert max(progress) <= 4096
+
+
+def test_copy_file_without_file_descriptor():
+    src, dst = io.BytesIO(b"echo" * 10), io.BytesIO()
+    copy_file(src, dst, on_progress=lambda size: None, buffer_size=3)
+
+    assert dst.getvalue() == b"echo" * 10
+
+
+def test_chunked_upload_in_any_order(tmp_path, drive: LocalDrive):
+    fileserver = FileServer(drive=drive, base_dir=str(tmp_path / "fileserver"))
+
+    assert fileserver.create_upload_session("echo", size=10, chunk_size=4)["chunk_count"] == 3
+    fileserver.upload_chunk("echo", 2, b"89")
+    fileserver.upload_chunk("echo", 0, b"0123")
+    # Resuming the upload keeps the chunks which were already received
+    assert fileserver.create_upload_session("echo", size=10, chunk_size=4)["received"] == [0, 2]
+
+    with pytest.raises(HTTPException) as e:
+        fileserver.upload_chunk("echo", 1, b"45")
+    assert e.value.status_code == 400
+    with pytest.raises(HTTPException) as e:
+        fileserver.finalize_upload_session("echo")
+    assert e.value.status_code == 409
+
+    fileserver.upload_chunk("echo", 1, b"4567")
+    fileserver.upload_chunk("echo", 1, b"4567")
+    assert fileserver.get_upload_progress("echo") == {"received": 10, "total": 10, "done": False}
+
+    assert fileserver.finalize_upload_session("echo")["size"] == 10
+    assert fileserver.get_upload_progress("echo")["done"]
+
+
+def test_metadata_index_is_loaded_from_drive(tmp_path, drive: LocalDrive):
+    fileserver = FileServer(drive=drive, base_dir=str(tmp_path / "fileserver"))
+    fileserver.create_upload_session("echo", size=4, chunk_size=4)
+    fileserver.upload_chunk("echo", 0, b"echo")
+    meta = fileserver.finalize_upload_session("echo")
+
+    assert meta["sha256"] == hashlib.sha256(b"echo").hexdigest()
+    assert meta["mimetype"] == "text/plain"
+
+    # A new fileserver (e.g. after a restart) reads the metadata from the Drive instead of inspecting the file again
+    assert FileServer(drive=drive, base_dir=str(tmp_path / "fileserver")).get_metadata("echo") == meta
+
+
+def test_upload_replaces_cached_copy(tmp_path, drive: LocalDrive):
+    fileserver = FileServer(drive=drive, base_dir=str(tmp_path / "fileserver"))
+
+    def upload(content: bytes):
+        fileserver.create_upload_session("echo", size=len(content), chunk_size=len(content))
+        fileserver.upload_chunk("echo", 0, content)
+        fileserver.finalize_upload_session("echo")
+
+    def download() -> bytes:
+        response = fileserver.download_file("echo")
+        try:
+            with open(response.path, "rb") as f:
+                return f.read()
+        finally:
+            fileserver._get_cache().release("echo")
+
+    upload(b"echo")
+    assert download() == b"echo"
+
+    # Saving the new upload removes the local copy, which is then fetched again
+    upload(b"echo, echo")
+    assert download() == b"echo, echo"
+    assert fileserver.cache_misses == 2
+
+
+def test_download_validators_come_from_metadata(tmp_path, drive: LocalDrive):
+    fileserver = FileServer(drive=drive, base_dir=str(tmp_path / "fileserver"))
+    fileserver.create_upload_session("echo", size=4, chunk_size=4)
+    fileserver.upload_chunk("echo", 0, b"echo")
+    meta = fileserver.finalize_upload_session("echo")
+
+    def last_modified() -> str:
+        response = fileserver.download_file("echo")
+        fileserver._get_cache().release("echo")
+        return response.headers["last-modified"]
+
+    first = last_modified()
+    # The local copy is newer whenever it was fetched again, e.g. after it was evicted or the fileserver restarted
+    os.utime(tmp_path / "fileserver" / "echo", (meta["uploaded_at"] + 3600,) * 2)
+
+    assert last_modified() == first == formatdate(meta["uploaded_at"], usegmt=True)
@@ -0,0 +1,417 @@
+import functools
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from echo.components import recognizer as recognizer_module
+from echo.components.database import server
+from echo.components.recognizer import SpeechRecognizer
+from echo.media.audio import PCM_EXTENSION, SAMPLE_RATE, SAMPLE_WIDTH_BYTES
+from echo.models.echo import QUALITY_DRAFT, QUALITY_FINAL, Echo
+from echo.models.general import GeneralModel
+from echo.models.segment import Segment
+from echo.utils.cancellation import CancellationToken, JobCancelledError
+
+
+class LocalDatabaseClient:
+    """Stands in for `DatabaseClient`, calling the handlers of the database server directly instead of over HTTP."""
+
+    # Every Echo saved by the recognizer, in order
+    puts: List[Echo] = []
+
+    def __init__(self, model=None, db_url: str = None):
+        pass
+
+    def get_echo(self, echo_id: str) -> Optional[Echo]:
+        return server.get_echo(echo_id)
+
+    def list_segments_for_echo(self, echo_id: str) -> List[Segment]:
+        return server.list_segments_for_echo(echo_id)
+
+    def create_segments_for_echo(self, segments: List[Segment]) -> bool:
+        try:
+            server.create_segments_for_echo(segments)
+        except HTTPException as e:
+            if e.status_code == 404:
+                return False
+            raise
+
+        return True
+
+    def delete_segments_for_echo(self, echo_id: str):
+        server.delete_segments_for_echo(echo_id)
+
+    def put(self, config: Echo) -> bool:
+        try:
+            server.general_put(GeneralModel.from_obj(config))
+        except HTTPException as e:
+            if e.status_code == 404:
+                return False
+            raise
+
+        self.puts.append(config.copy())
+        return True
+
+
+class FakeEngine:
+    """Stands in for `WhisperServerPool`, returning one segment per chunk which covers the whole chunk.
+
+    Clearing `unblocked` holds back every transcription until it is set again (or the job is cancelled).
+    """
+
+    def __init__(self, size: int = 2, text: str = "speech"):
+        self.size = size
+        self.text = text
+        self.transcribed: List[bytes] = []
+        self.cancelled: List[str] = []
+        self.started = threading.Event()
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def is_ready(self) -> bool:
+        return True
+
+    def stop(self):
+        pass
+
+    def transcribe(self, pcm: bytes, job_id: Optional[str] = None) -> Dict[str, Any]:
+        self.started.set()
+        self.unblocked.wait()
+        self.transcribed.append(pcm)
+        seconds = len(pcm) / SAMPLE_WIDTH_BYTES / SAMPLE_RATE
+        return {"segments": [{"start": 0.0, "end": seconds, "text": f" {self.text}"}]}
+
+    def cancel(self, job_id: str):
+        self.cancelled.append(job_id)
+        self.unblocked.set()
+
+
+def tone(seconds: float) -> List[bytes]:
+    """Returns audio in one-second buffers, like `decode_pcm`."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pcm = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16).tobytes()
+    return [pcm[i : i + SAMPLE_RATE * SAMPLE_WIDTH_BYTES] for i in range(0, len(pcm), SAMPLE_RATE * SAMPLE_WIDTH_BYTES)]
+
+
+def create_echo(echo_id: str = "echo", duration_seconds: Optional[float] = None) -> Echo:
+    echo = Echo(id=echo_id, source_file_path=echo_id, media_type="audio/mpeg", duration_seconds=duration_seconds)
+    server.general_post(GeneralModel.from_obj(echo))
+    return echo
+
+
+@pytest.fixture
+def recognizer(database, monkeypatch) -> SpeechRecognizer:
+    monkeypatch.setattr(recognizer_module, "DatabaseClient", LocalDatabaseClient)
+    monkeypatch.setattr(LocalDatabaseClient, "puts", [])
+
+    recognizer = SpeechRecognizer()
+    recognizer.vad_enabled = False
+    recognizer.cache_max_size_mb = 0
+    recognizer._engine = FakeEngine()
+    recognizer.start_engine()
+    return recognizer
+
+
+def test_transcribe_echo_saves_segments_as_chunks_finish(recognizer: SpeechRecognizer):
+    echo = create_echo()
+
+    recognizer.transcribe_echo(echo, db_url="", pcm=tone(70))
+
+    segments = server.list_segments_for_echo(echo.id)
+    # Long audio is split into chunks of at most 30 seconds, whose segments keep their position in the whole audio
+    assert len(segments) >= 3
+    assert [segment.id for segment in segments] == [f"echo-{index}" for index in range(len(segments))]
+    assert all(segment.end - segment.start <= 30 for segment in segments)
+    assert segments[0].start == 0 and segments[-1].end == pytest.approx(70)
+    assert all(previous.end == segment.start for previous, segment in zip(segments, segments[1:]))
+
+    # Progress is saved after every chunk, before the whole transcript is ready
+    progress = LocalDatabaseClient.puts[: len(segments)]
+    assert [echo.transcribed_until for echo in progress] == [segment.end for segment in segments]
+    assert all(echo.completed_transcription_at is None for echo in progress)
+
+    saved = server.get_echo(echo.id)
+    assert saved.text == "\n".join(["speech"] * len(segments))
+    assert saved.quality == QUALITY_FINAL
+    assert saved.completed_transcription_at is not None
+
+
+@pytest.fixture
+def decoded(monkeypatch, tmp_path) -> List[str]:
+    """Decodes every source to the same audio, returning the list of decoded sources."""
+    sources = []
+
+    def decode_pcm(source_file_path: str):
+        sources.append(source_file_path)
+        yield from tone(40)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(recognizer_module, "decode_pcm", decode_pcm)
+    monkeypatch.setattr(recognizer_module, "contains_audio", lambda source_file_path: True)
+    return sources
+
+
+def test_transcribe_echo_decodes_source_once_and_reuses_cached_result(recognizer: SpeechRecognizer, decoded):
+    recognizer.cache_max_size_mb = 1
+    first, second = create_echo("first"), create_echo("second")
+
+    recognizer.transcribe_echo(first, db_url="")
+    transcribed = len(recognizer._engine.transcribed)
+    recognizer.transcribe_echo(second, db_url="")
+
+    # The cache key and the transcription share the decoded audio, which is removed afterwards
+    assert decoded == ["first", "second"]
+    assert not os.path.exists("first.pcm")
+    # The same audio is only transcribed once
+    assert len(recognizer._engine.transcribed) == transcribed
+    assert (recognizer.cache_hits, recognizer.cache_misses) == (1, 1)
+    assert server.get_echo("second").text == server.get_echo("first").text
+    assert [segment.end for segment in server.list_segments_for_echo("second")] == [
+        segment.end for segment in server.list_segments_for_echo("first")
+    ]
+
+
+@pytest.fixture
+def two_pass_recognizer(recognizer: SpeechRecognizer) -> SpeechRecognizer:
+    recognizer.draft_model_size = "tiny"
+    recognizer.model = "base"
+    recognizer._draft_engine = FakeEngine(text="draft")
+    recognizer._engine = FakeEngine(text="final")
+    return recognizer
+
+
+def test_transcribe_in_two_passes_replaces_draft(two_pass_recognizer: SpeechRecognizer):
+    echo = create_echo()
+
+    two_pass_recognizer.transcribe_echo(echo, db_url="", pcm=tone(40))
+
+    # The draft was saved as a whole before the refined transcript
+    # NOTE: The draft keeps being shown (with the progress of the refinement) until the refined transcript is ready
+    drafts = [echo for echo in LocalDatabaseClient.puts if echo.quality == QUALITY_DRAFT and echo.text is not None]
+    assert len(drafts) > 0
+    assert all(set(draft.text.split("\n")) == {"draft"} for draft in drafts)
+    assert drafts[0].model == "tiny"
+
+    # Both passes transcribe the same chunks
+    assert two_pass_recognizer._draft_engine.transcribed == two_pass_recognizer._engine.transcribed
+    assert {segment.text for segment in server.list_segments_for_echo(echo.id)} == {"final"}
+    saved = server.get_echo(echo.id)
+    assert (saved.quality, saved.model) == (QUALITY_FINAL, "base")
+    assert set(saved.text.split("\n")) == {"final"}
+
+
+def test_transcribe_in_two_passes_skips_refinement_of_deleted_echo(two_pass_recognizer: SpeechRecognizer, monkeypatch):
+    echo = create_echo()
+    put = LocalDatabaseClient.put
+
+    def delete_after_draft(self, config: Echo) -> bool:
+        saved = put(self, config)
+        if config.quality == QUALITY_DRAFT and config.text is not None:
+            server.delete_echo(config.id)
+        return saved
+
+    monkeypatch.setattr(LocalDatabaseClient, "put", delete_after_draft)
+
+    with pytest.raises(JobCancelledError):
+        two_pass_recognizer.transcribe_echo(echo, db_url="", pcm=tone(40))
+
+    assert two_pass_recognizer._engine.transcribed == []
+    assert server.list_segments_for_echo(echo.id) == []
+
+
+@pytest.fixture
+def slotted_recognizer(recognizer: SpeechRecognizer, decoded, monkeypatch) -> SpeechRecognizer:
+    monkeypatch.setattr(SpeechRecognizer, "download_source", lambda self, echo, cancellation: echo.source_file_path)
+    # Notice deleted Echoes right away
+    monkeypatch.setattr(
+        recognizer_module, "CancellationToken", functools.partial(CancellationToken, interval_seconds=0)
+    )
+    recognizer.slots = 1
+    recognizer.prefetch_depth = 1
+    return recognizer
+
+
+def wait_for_jobs(recognizer: SpeechRecognizer):
+    recognizer._prefetcher.shutdown(wait=True)
+    recognizer._executor.shutdown(wait=True)
+
+
+@pytest.mark.parametrize("prefetch_max_size_mb, prefetched", [(2, True), (1, False)])
+def test_prefetch_within_budget(slotted_recognizer: SpeechRecognizer, prefetch_max_size_mb: int, prefetched: bool):
+    slotted_recognizer.prefetch_max_size_mb = prefetch_max_size_mb
+    echo = create_echo()
+
+    # 40 seconds of decoded audio take 1.28 MB
+    audio_file_path, pcm = slotted_recognizer.prefetch(echo, CancellationToken(echo.id, is_cancelled=lambda: False))
+
+    assert audio_file_path == echo.source_file_path
+    assert (pcm is not None) == prefetched
+    # Audio that is not prefetched is released from the budget right away
+    assert slotted_recognizer._prefetched_bytes == (sum(len(buffer) for buffer in pcm) if prefetched else 0)
+
+
+def test_run_accounts_slots_and_pending_cost(slotted_recognizer: SpeechRecognizer):
+    engine = slotted_recognizer._engine
+    engine.unblocked.clear()
+    echo = create_echo(duration_seconds=40)
+
+    slotted_recognizer.run(echo, db_url="")
+    assert engine.started.wait(timeout=5)
+
+    assert slotted_recognizer.free_slots == 0
+    assert slotted_recognizer.pending_cost == 40
+
+    engine.unblocked.set()
+    wait_for_jobs(slotted_recognizer)
+
+    assert slotted_recognizer.free_slots == 1
+    assert slotted_recognizer.pending_cost == 0
+    assert slotted_recognizer._prefetched_bytes == 0
+    assert server.get_echo(echo.id).completed_transcription_at is not None
+
+
+def test_run_cancels_job_of_deleted_echo(slotted_recognizer: SpeechRecognizer):
+    engine = slotted_recognizer._engine
+    engine.unblocked.clear()
+    echo = create_echo(duration_seconds=40)
+
+    slotted_recognizer.run(echo, db_url="")
+    assert engine.started.wait(timeout=5)
+    server.delete_echo(echo.id)
+    wait_for_jobs(slotted_recognizer)
+
+    # The chunks being transcribed are aborted and the slot is freed
+    assert engine.cancelled == [echo.id]
+    assert server.list_segments_for_echo(echo.id) == []
+    assert slotted_recognizer.free_slots == 1
+    assert slotted_recognizer._prefetched_bytes == 0
+
+
+def test_transcribe_echo_saves_no_segments_for_echo_deleted_mid_run(recognizer: SpeechRecognizer):
+    echo = create_echo()
+    # A single engine transcribes one chunk at a time
+    engine = recognizer._engine = FakeEngine(size=1)
+    transcribe = engine.transcribe
+
+    def delete_during_second_chunk(pcm: bytes, job_id: Optional[str] = None) -> Dict[str, Any]:
+        if len(engine.transcribed) == 1:
+            server.delete_echo(echo.id)
+        return transcribe(pcm, job_id)
+
+    engine.transcribe = delete_during_second_chunk
+
+    # NOTE: The deletion happens between two checks of the cancellation token, so only the database can tell
+    with pytest.raises(JobCancelledError):
+        recognizer.transcribe_echo(echo, db_url="", pcm=tone(70))
+
+    assert server.list_segments_for_echo(echo.id) == []
+
+
+class LocalDrive:
+    """Stands in for the shared Drive, which stores its files in another local directory."""
+
+    def __init__(self, storage: str):
+        self.storage = storage
+
+    def get(self, path: str, **kwargs):
+        shutil.copy(os.path.join(self.storage, path), path)
+
+
+def upload(storage: str, echo_id: str, meta: Optional[Dict[str, Any]] = None):
+    """Saves the files the fileserver stores for an uploaded file, where the metadata is saved last."""
+    with open(os.path.join(storage, echo_id), "wb") as f:
+        f.write(b"media")
+    if meta is None:
+        return
+
+    if meta.get("audio") is not None:
+        with open(os.path.join(storage, f"{echo_id}{PCM_EXTENSION}"), "wb") as f:
+            f.write(b"".join(tone(1)))
+    with open(os.path.join(storage, f"{echo_id}.meta"), "w") as f:
+        json.dump(meta, f)
+
+
+UPLOAD_META = {"has_audio": True, "audio": {"path": f"echo{PCM_EXTENSION}"}}
+
+
+@pytest.fixture
+def drive(recognizer: SpeechRecognizer, decoded, tmp_path) -> str:
+    """Returns the directory in which the files of the Drive are stored."""
+    storage = tmp_path / "drive"
+    storage.mkdir()
+    recognizer._drive = LocalDrive(str(storage))
+    return str(storage)
+
+
+def never_cancelled(echo: Echo) -> CancellationToken:
+    return CancellationToken(echo.id, is_cancelled=lambda: False)
+
+
+def test_download_source_prefers_decoded_audio(recognizer: SpeechRecognizer, drive: str):
+    echo = create_echo()
+    upload(drive, echo.id, meta=UPLOAD_META)
+
+    assert recognizer.download_source(echo, never_cancelled(echo)) == f"echo{PCM_EXTENSION}"
+    assert not os.path.exists("echo.meta")
+
+
+def test_download_source_waits_for_upload_to_finish(recognizer: SpeechRecognizer, drive: str, monkeypatch):
+    echo = create_echo()
+    upload(drive, echo.id)
+    # The fileserver saves the decoded audio and the metadata while the recognizer waits
+    monkeypatch.setattr(recognizer_module.time, "sleep", lambda seconds: upload(drive, echo.id, meta=UPLOAD_META))
+
+    assert recognizer.download_source(echo, never_cancelled(echo)) == f"echo{PCM_EXTENSION}"
+
+
+def test_download_source_waits_for_youtube_video_to_be_decoded(recognizer: SpeechRecognizer, drive: str, monkeypatch):
+    echo = create_echo()
+    echo.source_youtube_url = "https://www.youtube.com/watch?v=video"
+    # YouTube videos are uploaded through the fileserver as well, which saves the source before decoding its audio
+    upload(drive, echo.id)
+    monkeypatch.setattr(recognizer_module.time, "sleep", lambda seconds: upload(drive, echo.id, meta=UPLOAD_META))
+
+    assert recognizer.download_source(echo, never_cancelled(echo)) == f"echo{PCM_EXTENSION}"
+    assert not os.path.exists("echo")
+
+
+def test_download_source_falls_back_to_source_without_decoded_audio(recognizer: SpeechRecognizer, drive: str):
+    echo = create_echo()
+    upload(drive, echo.id, meta={"has_audio": None, "audio": None})
+
+    assert recognizer.download_source(echo, never_cancelled(echo)) == "echo"
+
+
+def test_run_removes_downloaded_files(recognizer: SpeechRecognizer, drive: str):
+    echo = create_echo()
+    upload(drive, echo.id, meta=UPLOAD_META)
+    # Works running locally share their working directory, e.g. with the copy of the source kept by the fileserver
+    with open("echo", "wb") as f:
+        f.write(b"media")
+
+    recognizer.run(echo, db_url="")
+    wait_for_jobs(recognizer)
+
+    assert server.get_echo(echo.id).completed_transcription_at is not None
+    assert not any(os.path.exists(file_path) for file_path in [f"echo{PCM_EXTENSION}", "echo.meta"])
+    assert os.path.exists("echo")
+
+
+def test_prefetch_removes_download_of_cancelled_job(recognizer: SpeechRecognizer, drive: str):
+    echo = create_echo()
+    upload(drive, echo.id, meta=UPLOAD_META)
+    # The Echo is deleted as soon as its audio was downloaded
+    cancellation = CancellationToken(
+        echo.id, is_cancelled=lambda: os.path.exists(f"echo{PCM_EXTENSION}"), interval_seconds=0
+    )
+
+    with pytest.raises(JobCancelledError):
+        recognizer.prefetch(echo, cancellation)
+
+    assert not os.path.exists(f"echo{PCM_EXTENSION}")
@@ -0,0 +1,39 @@
+import json
+import os
+
+import pytest
+
+from echo.components.whisper import MEASUREMENTS_FILENAME, ModelRegistry, WhisperModel, model_candidates
+
+
+def test_model_candidates_from_least_to_most_accurate():
+    names = [model.name for model in model_candidates("base")]
+
+    assert names == ["tiny-q5_0", "tiny-q8_0", "tiny", "base-q5_0", "base-q8_0", "base"]
+    assert [model.name for model in model_candidates("base.en")] == ["base.en-q5_0", "base.en-q8_0", "base.en"]
+
+
+@pytest.mark.parametrize(
+    "min_speed, expected",
+    [
+        (1, "base"),
+        (6, "base-q5_0"),
+        (15, "tiny-q8_0"),
+        # Nothing is fast enough, so the fastest model is used
+        (100, "tiny-q5_0"),
+    ],
+)
+def test_model_registry_select(tmpdir, min_speed: float, expected: str):
+    # Seconds per second of audio, i.e. the inverse of the speed
+    real_time_factors = {"tiny-q5_0": 0.05, "tiny-q8_0": 0.06, "tiny": 0.08, "base-q5_0": 0.15, "base": 0.25}
+
+    os.makedirs(os.path.join(tmpdir, "models"))
+    for name in real_time_factors:
+        open(os.path.join(tmpdir, "models", f"ggml-{name}.bin"), "w").close()
+    with open(os.path.join(tmpdir, "models", MEASUREMENTS_FILENAME), "w") as f:
+        json.dump({f"{name}@4": rtf for name, rtf in real_time_factors.items()}, f)
+
+    registry = ModelRegistry(str(tmpdir), candidates=model_candidates("base"), threads=4)
+
+    assert not registry.is_installed(WhisperModel("base", "q8_0"))
+    assert registry.select(min_speed).name == expected
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from echo.media.audio import (
+    SAMPLE_RATE,
+    SpeechStats,
+    iter_chunks,
+    iter_speech_chunks,
+    read_pcm,
+    split_on_silence,
+)
+
+
+def _tone(seconds: float, amplitude: int = 8000) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def _silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+
+def test_split_on_silence_short_audio_is_single_chunk():
+    pcm = _tone(5).tobytes()
+
+    chunks = split_on_silence(pcm)
+
+    assert chunks == [(0, pcm)]
+
+
+@pytest.mark.parametrize("silence_at", [12, 20, 27])
+def test_split_on_silence_cuts_at_silence(silence_at: int):
+    samples = np.concatenate([_tone(silence_at), _silence(0.5), _tone(40 - silence_at)])
+
+    chunks = split_on_silence(samples.tobytes(), min_chunk_seconds=10, max_chunk_seconds=30)
+
+    first_cut = chunks[1][0] / SAMPLE_RATE
+    assert silence_at <= first_cut <= silence_at + 0.5
+
+
+def test_split_on_silence_preserves_all_samples():
+    samples = np.concatenate([_tone(25), _silence(1), _tone(25), _silence(1), _tone(25)])
+
+    chunks = split_on_silence(samples.tobytes(), min_chunk_seconds=10, max_chunk_seconds=30)
+
+    assert all(len(chunk) <= 30 * SAMPLE_RATE * 2 for _, chunk in chunks)
+    assert b"".join(chunk for _, chunk in chunks) == samples.tobytes()
+    assert [offset for offset, _ in chunks] == np.cumsum([0] + [len(chunk) // 2 for _, chunk in chunks[:-1]]).tolist()
+
+
+def test_iter_chunks_matches_in_memory_split():
+    samples = np.concatenate([_tone(17), _silence(0.5), _tone(22), _silence(1), _tone(31)])
+    pcm = samples.tobytes()
+    # Odd-sized buffers to make sure samples split across reads are handled
+    buffers = [pcm[i : i + 3001] for i in range(0, len(pcm), 3001)]
+
+    assert list(iter_chunks(buffers)) == split_on_silence(pcm)
+
+
+def test_read_pcm_matches_decoded_buffers(tmp_path):
+    pcm = np.concatenate([_tone(2.5), _silence(1)]).tobytes()
+    (tmp_path / "audio.pcm").write_bytes(pcm)
+
+    buffers = list(read_pcm(str(tmp_path / "audio.pcm")))
+
+    assert b"".join(buffers) == pcm
+    assert all(len(buffer) == SAMPLE_RATE * 2 for buffer in buffers[:-1])
+
+
+def test_iter_speech_chunks_drops_silence_and_keeps_original_offsets():
+    samples = np.concatenate([_silence(10), _tone(5), _silence(20), _tone(8), _silence(3)])
+    stats = SpeechStats()
+
+    chunks = list(iter_speech_chunks([samples.tobytes()], stats=stats))
+
+    assert len(chunks) == 2
+    starts = [offset / SAMPLE_RATE for offset, _ in chunks]
+    ends = [(offset + len(chunk) // 2) / SAMPLE_RATE for offset, chunk in chunks]
+    assert 9.5 <= starts[0] <= 10 and 15 <= ends[0] <= 15.5
+    assert 34.5 <= starts[1] <= 35 and 43 <= ends[1] <= 43.5
+    # Kept audio is identical to the original audio at the same position
+    for offset, chunk in chunks:
+        assert chunk == samples[offset : offset + len(chunk) // 2].tobytes()
+
+    assert stats.total_seconds == pytest.approx(46)
+    assert stats.dropped_seconds == pytest.approx(46 - sum(end - start for start, end in zip(starts, ends)))
+
+
+def test_iter_speech_chunks_keeps_short_pauses():
+    samples = np.concatenate([_tone(5), _silence(1), _tone(5)])
+
+    chunks = list(iter_speech_chunks([samples.tobytes()]))
+
+    assert chunks == [(0, samples.tobytes())]
+
+
+def test_iter_speech_chunks_keeps_quiet_recordings():
+    # Quiet background noise and speech, which is far below the level of typical recordings
+    noise = np.random.default_rng(0).normal(0, 2, int(46 * SAMPLE_RATE)).astype(np.int16)
+    speech = np.concatenate([_silence(10), _tone(5, amplitude=100), _silence(20), _tone(8, amplitude=100), _silence(3)])
+
+    chunks = list(iter_speech_chunks([(noise + speech).tobytes()]))
+
+    assert len(chunks) == 2
+    assert 9.5 <= chunks[0][0] / SAMPLE_RATE <= 10
+    assert 34.5 <= chunks[1][0] / SAMPLE_RATE <= 35
@@ -0,0 +1,107 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from echo.utils.cache import DiskCache, FileCache
+
+
+def test_disk_cache_hits_and_misses(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size_bytes=1024)
+
+    assert cache.get("missing") is None
+    cache.put("key", b"value")
+    assert cache.get("key") == b"value"
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size_bytes=20)
+
+    cache.put("a", b"x" * 10)
+    os.utime(tmp_path / "a", (1, 1))
+    cache.put("b", b"x" * 10)
+    os.utime(tmp_path / "b", (2, 2))
+
+    # Reading `a` makes `b` the least recently used entry
+    cache.get("a")
+    cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+class Fetcher:
+    def __init__(self, directory, size: int = 10):
+        self.directory = directory
+        self.size = size
+        self.fetched = []
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+
+    def __call__(self, key: str):
+        self.fetched.append(key)
+        self.started.set()
+        self.proceed.wait()
+        if key == "missing":
+            raise FileNotFoundError(key)
+        (self.directory / key).write_bytes(b"x" * self.size)
+
+
+def test_file_cache_evicts_least_recently_used_unpinned_files(tmp_path):
+    cache = FileCache(str(tmp_path), max_size_bytes=20, fetch=Fetcher(tmp_path))
+
+    def download(key: str):
+        cache.acquire(key)
+        cache.release(key)
+
+    download("a")
+    download("b")
+    # `a` is still being downloaded, so `b` is evicted even though `a` was used less recently
+    cache.acquire("a")
+    download("b")
+    download("c")
+
+    assert not (tmp_path / "b").exists()
+    assert (tmp_path / "a").exists() and (tmp_path / "c").exists()
+    assert (cache.hits, cache.misses, cache.evictions) == (2, 3, 1)
+
+
+def test_file_cache_fetches_once_for_concurrent_requests(tmp_path):
+    fetcher = Fetcher(tmp_path)
+    fetcher.proceed.clear()
+    cache = FileCache(str(tmp_path), max_size_bytes=100, fetch=fetcher)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(cache.acquire, "a")]
+        fetcher.started.wait()
+        futures += [executor.submit(cache.acquire, "a") for _ in range(3)]
+        fetcher.proceed.set()
+        paths = {future.result() for future in futures}
+
+    assert paths == {str(tmp_path / "a")}
+    assert fetcher.fetched == ["a"]
+
+    with pytest.raises(FileNotFoundError):
+        cache.acquire("missing")
+    assert cache.size_bytes == 10
+
+
+def test_file_cache_fetches_removed_files_again(tmp_path):
+    fetcher = Fetcher(tmp_path)
+    cache = FileCache(str(tmp_path), max_size_bytes=100, fetch=fetcher)
+
+    cache.acquire("a")
+    cache.release("a")
+    os.remove(tmp_path / "a")
+    cache.acquire("a")
+    cache.release("a")
+
+    assert (tmp_path / "a").exists()
+    assert fetcher.fetched == ["a", "a"]
+    assert (cache.hits, cache.misses, cache.size_bytes) == (0, 2, 10)
@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from echo.utils.cancellation import CancellationToken, JobCancelledError
+
+
+def test_cancellation_token_throttles_checks():
+    checks = []
+
+    def is_cancelled():
+        checks.append(True)
+        return len(checks) > 1
+
+    token = CancellationToken("job", is_cancelled=is_cancelled, interval_seconds=60)
+
+    assert not token.cancelled()
+    assert not token.cancelled()
+    assert len(checks) == 1
+
+    with pytest.raises(JobCancelledError):
+        token.raise_if_cancelled(force=True)
+    assert len(checks) == 2
+
+    # Once cancelled, the job stays cancelled without checking again
+    assert token.cancelled(force=True)
+    assert len(checks) == 2
+
+
+def test_cancellation_token_ignores_failing_checks():
+    def is_cancelled():
+        raise ConnectionError
+
+    token = CancellationToken("job", is_cancelled=is_cancelled)
+
+    assert not token.cancelled()
+
+
+def test_cancellation_token_wait():
+    token = CancellationToken("job", is_cancelled=lambda: False, interval_seconds=0.01)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert token.wait(executor.submit(lambda: 42)) == 42
+
+        token.cancel()
+        with pytest.raises(JobCancelledError):
+            token.wait(executor.submit(time.sleep, 0.1))
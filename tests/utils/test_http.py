@@ -0,0 +1,125 @@
+import asyncio
+from typing import Dict, Tuple
+
+import pytest
+from starlette.datastructures import Headers
+
+from echo.utils.http import MAX_RANGES, RangeNotSatisfiable, etag_matches, file_response, make_etag, parse_range
+
+CONTENT = bytes(range(100))
+ETAG = make_etag("echo", len(CONTENT))
+LAST_MODIFIED = 1672531200.0
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("bytes=0-9", [(0, 9)]),
+        ("bytes=90-", [(90, 99)]),
+        ("bytes=-10", [(90, 99)]),
+        ("bytes=95-200", [(95, 99)]),
+        ("bytes=0-0, 50-59", [(0, 0), (50, 59)]),
+        ("bytes=200-300, 10-19", [(10, 19)]),
+        # Overlapping and adjacent ranges are merged
+        ("bytes=0-,0-,0-,0-", [(0, 99)]),
+        ("bytes=50-59, 0-9, 5-14, 15-19", [(0, 19), (50, 59)]),
+        # Too many ranges are answered with the whole file
+        ("bytes=" + ",".join(f"{2 * index}-{2 * index}" for index in range(MAX_RANGES + 1)), None),
+        ("bytes=9-0", None),
+        ("bytes=abc", None),
+        ("items=0-9", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, len(CONTENT)) == expected
+
+
+def test_parse_range_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", len(CONTENT))
+
+
+def test_etag_matches():
+    assert etag_matches(f'"other", {ETAG}', ETAG)
+    assert etag_matches(f"W/{ETAG}", ETAG)
+    assert not etag_matches(f"W/{ETAG}", ETAG, weak=False)
+    assert etag_matches("*", ETAG)
+
+
+class Download:
+    def __init__(self, path: str):
+        self.path = path
+
+    def get(self, headers: Dict[str, str] = None) -> Tuple[int, Headers, bytes]:
+        """Sends the response for a request with the given headers, returning the status, headers and body."""
+        response = file_response(
+            self.path, Headers(headers or {}), media_type="audio/mpeg", etag=ETAG, last_modified=LAST_MODIFIED
+        )
+        messages = []
+
+        async def run():
+            done = asyncio.Event()
+
+            async def receive():
+                # The client only disconnects once the whole body was sent
+                await done.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                messages.append(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    done.set()
+
+            await response({"type": "http", "method": "GET"}, receive, send)
+
+        asyncio.run(run())
+
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        return messages[0]["status"], Headers(raw=messages[0]["headers"]), body
+
+
+@pytest.fixture
+def client(tmp_path) -> Download:
+    (tmp_path / "media").write_bytes(CONTENT)
+
+    return Download(str(tmp_path / "media"))
+
+
+def test_file_response_sends_whole_file_with_validators(client: Download):
+    status, headers, body = client.get()
+
+    assert status == 200
+    assert body == CONTENT
+    assert headers["etag"] == ETAG
+    assert headers["last-modified"] == "Sun, 01 Jan 2023 00:00:00 GMT"
+    assert "immutable" in headers["cache-control"]
+
+
+def test_file_response_single_range(client: Download):
+    status, headers, body = client.get({"Range": "bytes=10-19"})
+
+    assert status == 206
+    assert body == CONTENT[10:20]
+    assert headers["content-range"] == "bytes 10-19/100"
+
+
+def test_file_response_multiple_ranges(client: Download):
+    status, headers, body = client.get({"Range": "bytes=0-1, 98-"})
+
+    assert status == 206
+    assert headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(headers["content-length"]) == len(body)
+    assert b"Content-Range: bytes 0-1/100\r\n\r\n" + CONTENT[:2] in body
+    assert b"Content-Range: bytes 98-99/100\r\n\r\n" + CONTENT[98:] in body
+
+
+def test_file_response_conditional(client: Download):
+    assert client.get({"If-None-Match": ETAG})[0] == 304
+    last_modified = client.get()[1]["last-modified"]
+    assert client.get({"If-Modified-Since": last_modified})[0] == 304
+
+    assert client.get({"Range": "bytes=200-"})[0] == 416
+    # A range of an outdated version is never combined with the current one
+    assert client.get({"Range": "bytes=0-9", "If-Range": '"outdated"'})[0] == 200
+    assert client.get({"Range": "bytes=0-9", "If-Range": ETAG})[0] == 206
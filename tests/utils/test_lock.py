@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from echo.utils.lock import FairLock
+
+
+def test_fair_lock_is_acquired_in_order():
+    lock = FairLock()
+    order = []
+
+    def acquire(index: int):
+        with lock:
+            order.append(index)
+
+    lock.acquire()
+    threads = []
+    for index in range(5):
+        thread = threading.Thread(target=acquire, args=(index,))
+        thread.start()
+        threads.append(thread)
+        # Wait for the thread to queue up before starting the next one
+        while len(lock._waiters) <= index:
+            time.sleep(0.001)
+
+    lock.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == [0, 1, 2, 3, 4]
+    assert not lock.locked()
+
+
+def test_fair_lock_hands_over_to_waiting_threads():
+    lock = FairLock()
+    acquired, done = threading.Event(), threading.Event()
+
+    def wait():
+        with lock:
+            acquired.set()
+            done.wait()
+
+    lock.acquire()
+    thread = threading.Thread(target=wait)
+    thread.start()
+    while len(lock._waiters) == 0:
+        time.sleep(0.001)
+
+    lock.release()
+    assert acquired.wait(timeout=5)
+    assert lock.locked()
+
+    done.set()
+    thread.join()
+    assert not lock.locked()
+
+
+def test_fair_lock_cannot_be_released_when_unlocked():
+    with pytest.raises(RuntimeError):
+        FairLock().release()